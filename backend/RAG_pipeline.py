@@ -1,86 +1,166 @@
 # backend/pipeline.py
 
-from typing import Dict, List
+from typing import Awaitable, Callable, Dict, List, Optional
 import config
 import re
-from backend.embeddings import embed_texts
+import threading
+import time
+from backend import embeddings
+from backend.embeddings import aembed_query, embed_query
 from backend import retrieval
 from backend import llm
+from backend.reranker import get_reranker
 
 
 
 # =========================
 # 1. Build context string
 # =========================
-def build_context_from_docs(docs: List[Dict], per_doc_chars: int = 1000) -> str:
+_WHITESPACE_RE = re.compile(r"\s+")
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s|$)")
+_MIN_OVERLAP_CHARS = 20  # shorter shared prefixes/suffixes are coincidence, not chunk overlap
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """The tiktoken encoding used to count context tokens (loaded on first use)."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(config.CONTEXT_ENCODING)
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+
+def _strip_overlap(text: str, emitted: List[str], max_overlap: int) -> str:
+    """
+    Remove text shared with what earlier chunks put in the context: the splitter repeats up
+    to CHUNK_OVERLAP characters between adjacent chunks (end of one = start of the next).
     """
-    Build a single context string from retrieved docs.
-    Keeps up to per_doc_chars characters but extends to finish the current sentence
-    (so we don't cut off useful sentences mid-way).
+    for prev in emitted:
+        limit = min(max_overlap, len(prev), len(text))
+        for k in range(limit, _MIN_OVERLAP_CHARS - 1, -1):
+            if prev.endswith(text[:k]):      # prev comes right before text
+                text = text[k:].lstrip()
+                break
+            if prev.startswith(text[-k:]):   # prev comes right after text
+                text = text[:-k].rstrip()
+                break
+    return text
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """First max_tokens tokens of text, cut back to the last full sentence when one ends in the second half."""
+    encoding = get_encoding()
+    head = encoding.decode(encoding.encode(text)[:max_tokens])
+    ends = [m.end() for m in _SENTENCE_END_RE.finditer(head)]
+    if ends and ends[-1] >= len(head) // 2:
+        return head[:ends[-1]]
+    return head.rstrip()
+
+
+def build_context_from_docs(docs: List[Dict], max_tokens: Optional[int] = None) -> str:
+    """
+    Build a single context string from retrieved docs, best first, within a token budget
+    (max_tokens, default config.CONTEXT_TOKEN_BUDGET, counted with tiktoken including
+    source tags and separators), so the prompt size no longer depends on chunk length.
+    Text repeated between adjacent chunks (chunk overlap) and duplicate chunks are
+    dropped; the doc that crosses the budget is cut at a sentence end where possible.
     Returns a string like: "[source:doc_1] snippet...\n\n[source:doc_2] snippet..."
     """
+    budget = config.CONTEXT_TOKEN_BUDGET if max_tokens is None else max_tokens
+    separator_tokens = count_tokens("\n\n")
+    max_overlap = 2 * config.CHUNK_OVERLAP  # whitespace normalization can shift the boundary
     parts = []
+    emitted = []   # text each doc actually contributed (after overlap removal and truncation)
+    complete = set()  # snippets whose whole text is in the context
+    used = 0
     for d in docs:
         src = d.get("source") or f"doc_{d.get('_id')}"
-        text = d.get("text", "") or ""
         # normalize whitespace
-        snippet = re.sub(r'\s+', ' ', text).strip()
-        if len(snippet) <= per_doc_chars:
-            text_snippet = snippet
+        snippet = _WHITESPACE_RE.sub(" ", d.get("text", "") or "").strip()
+        if not snippet or snippet in complete:
+            continue
+        unique = _strip_overlap(snippet, emitted, max_overlap)
+        if not unique:
+            complete.add(snippet)
+            continue
+
+        header = f"[source:{src}] "
+        available = budget - used - count_tokens(header) - (separator_tokens if parts else 0)
+        if available <= 0:
+            break
+        if count_tokens(unique) > available:
+            unique = _truncate_to_tokens(unique, available)
+            if not unique:
+                break
         else:
-            head = snippet[:per_doc_chars]
-            tail = snippet[per_doc_chars:per_doc_chars + 1000]  # lookahead to complete sentence
-            m = re.search(r'([.!?])', tail)
-            if m:
-                end_idx = per_doc_chars + m.end()
-                text_snippet = snippet[:end_idx].strip()
-            else:
-                text_snippet = head.strip()
-        parts.append(f"[source:{src}] {text_snippet}")
-    return "\n\n".join(parts)
+            complete.add(snippet)
+        emitted.append(unique)
+        part = header + unique
+        used += count_tokens(part) + (separator_tokens if parts else 0)
+        parts.append(part)
+
+    context = "\n\n".join(parts)
+    excess = count_tokens(context) - budget  # tokens can merge across part boundaries
+    if excess > 0:
+        encoding = get_encoding()
+        context = encoding.decode(encoding.encode(context)[:budget]).rstrip()
+    return context
 
 # =========================
 # 2. Full RAG pipeline
 # =========================
-def run_rag_pipeline(question: str, top_k: int = 3, debug: bool = False) -> Dict:
-    """
-    End-to-end Retrieval-Augmented Generation pipeline:
-      1. Retrieve docs from MongoDB (Atlas or fallback)
-      2. Build context string
-      3. Format prompt
-      4. Call Azure OpenAI
-      5. Return structured result
-    """
-    # --- Step 1: Retrieve ---
-    try:
-        docs = retrieval.mongodb_vector_search(question, top_k=top_k)
-        if not docs:
-            raise RuntimeError("Atlas returned no results")
-    except Exception:
-        docs = retrieval.fallback_search(question, top_k=top_k)
-
+def _normalize_docs(docs: List[Dict]) -> List[Dict]:
+    """Give every retrieved doc the same keys regardless of which search path found it."""
     normalized = []
     for d in docs:
         normalized.append({
             "_id": d.get("_id"),
             "text": d.get("text", ""),
             "source": d.get("source") or f"doc_{d.get('_id')}",
-            "score": d.get("score")
+            "score": d.get("score"),
+            "vector_score": d.get("vector_score"),
         })
+    return normalized
 
+
+OUT_OF_DOMAIN_ANSWER = "I don't know."
+
+
+def best_vector_score(docs: List[Dict]) -> Optional[float]:
+    """Highest cosine similarity among retrieved docs (None if no doc has one)."""
+    scores = [d["vector_score"] for d in docs if d.get("vector_score") is not None]
+    return max(scores) if scores else None
+
+
+def _is_out_of_domain(docs: List[Dict], debug: bool = False) -> bool:
+    """True if RETRIEVAL_MIN_SCORE is set and nothing retrieved reaches it (skip the LLM)."""
+    if config.RETRIEVAL_MIN_SCORE <= 0:
+        return False
+    best = best_vector_score(docs)
+    if best is not None and best >= config.RETRIEVAL_MIN_SCORE:
+        return False
     if debug:
-        print(f"🔎 Retrieved {len(normalized)} docs")
+        print(f"🚫 Out of domain: best score {best} < {config.RETRIEVAL_MIN_SCORE}; LLM skipped")
+    return True
 
-    # --- Step 2: Build context ---
-    context = build_context_from_docs(normalized)
 
-    # --- Step 3: Format prompt ---
-    user_prompt = llm.build_user_prompt(context, question)
+def _out_of_domain_result(question: str, normalized: List[Dict]) -> Dict:
+    result = _build_result(question, OUT_OF_DOMAIN_ANSWER, normalized, "")
+    result["out_of_domain"] = True
+    return result
 
-    # --- Step 4: Call LLM ---
-    answer = llm.call_azure_chat(llm.SYSTEM_PROMPT, user_prompt, debug=debug)
 
-    # --- Step 5: Detect used sources ---
+def _build_result(question: str, answer: str, normalized: List[Dict], context: str) -> Dict:
+    """Detect which retrieved sources the answer cites and assemble the result dict."""
     used_sources = []
     for d in normalized:
         if f"[source:{d['source']}]" in answer:
@@ -95,8 +175,146 @@ def run_rag_pipeline(question: str, top_k: int = 3, debug: bool = False) -> Dict
     }
 
 
+def _retrieve_k(top_k: int) -> int:
+    """How many docs to retrieve: a wider candidate set when the reranker will cut it to top_k."""
+    return max(top_k, config.RERANK_CANDIDATES) if config.RERANK_ENABLED else top_k
+
+
+def run_rag_pipeline(question: str, top_k: int = 3, debug: bool = False, query_vector=None,
+                     retrieval_query: Optional[str] = None) -> Dict:
+    """
+    End-to-end Retrieval-Augmented Generation pipeline:
+      1. Retrieve docs (local in-process index, or MongoDB Atlas with fallback); with
+         RERANK_ENABLED, retrieve RERANK_CANDIDATES and keep the cross-encoder's top_k
+      2. Build context string
+      3. Format prompt
+      4. Call Azure OpenAI
+      5. Return structured result
+    If no retrieved doc reaches RETRIEVAL_MIN_SCORE, steps 2-4 are skipped: the answer is
+    OUT_OF_DOMAIN_ANSWER and the result has "out_of_domain": True.
+    Pass query_vector if the caller already embedded the question, and retrieval_query
+    to search with something shorter than the prompt question (e.g. a standalone
+    follow-up instead of a whole conversation); query_vector must then embed it.
+    """
+    # --- Step 1: Retrieve (embed the question once for every search path), then rerank ---
+    search_text = retrieval_query or question
+    if query_vector is None:
+        query_vector = embed_query(search_text)
+    docs = retrieval.search(search_text, top_k=_retrieve_k(top_k), query_vector=query_vector)
+    if _is_out_of_domain(docs, debug):
+        return _out_of_domain_result(question, _normalize_docs(docs[:top_k]))
+    if config.RERANK_ENABLED:
+        docs = get_reranker().rerank(search_text, docs, top_k=top_k)
+    normalized = _normalize_docs(docs)
+
+    if debug:
+        print(f"🔎 Retrieved {len(normalized)} docs")
+
+    # --- Step 2: Build context ---
+    context = build_context_from_docs(normalized)
+
+    # --- Step 3: Format prompt ---
+    user_prompt = llm.build_user_prompt(context, question)
+
+    # --- Step 4: Call LLM ---
+    answer = llm.call_azure_chat(llm.SYSTEM_PROMPT, user_prompt, debug=debug)
+
+    # --- Step 5: Detect used sources ---
+    return _build_result(question, answer, normalized, context)
+
+
+async def arun_rag_pipeline(question: str, top_k: int = 3, debug: bool = False,
+                            on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+                            query_vector=None, retrieval_query: Optional[str] = None) -> Dict:
+    """
+    Async run_rag_pipeline for event-loop callers (the Discord bot). Same steps and result.
+    Mongo and Azure calls are awaited on the loop; only CPU-bound work (embedding,
+    in-process index search) runs on the bounded embeddings.cpu_executor.
+    If on_delta is given, the completion is streamed and `await on_delta(delta)` runs for
+    every text delta; the returned "answer" is still the full text.
+    """
+    # --- Step 1: Retrieve, then rerank ---
+    search_text = retrieval_query or question
+    if query_vector is None:
+        query_vector = await aembed_query(search_text)
+    docs = await retrieval.asearch(search_text, top_k=_retrieve_k(top_k), query_vector=query_vector)
+    if _is_out_of_domain(docs, debug):
+        return _out_of_domain_result(question, _normalize_docs(docs[:top_k]))
+    if config.RERANK_ENABLED:
+        docs = await embeddings.run_in_cpu_executor(get_reranker().rerank, search_text, docs, top_k=top_k)
+    normalized = _normalize_docs(docs)
+
+    if debug:
+        print(f"🔎 Retrieved {len(normalized)} docs")
+
+    # --- Steps 2-3: Build context + prompt ---
+    context = build_context_from_docs(normalized)
+    user_prompt = llm.build_user_prompt(context, question)
+
+    # --- Step 4: Call LLM ---
+    if on_delta is None:
+        answer = await llm.acall_azure_chat(llm.SYSTEM_PROMPT, user_prompt, debug=debug)
+    else:
+        parts = []
+        async for delta in llm.astream_azure_chat(llm.SYSTEM_PROMPT, user_prompt, debug=debug):
+            parts.append(delta)
+            await on_delta(delta)
+        answer = "".join(parts).strip()
+
+    # --- Step 5: Detect used sources ---
+    return _build_result(question, answer, normalized, context)
+
+
+# =========================
+# 3. Warm start
+# =========================
+def warmup() -> Dict[str, float]:
+    """
+    Pay every lazy initialization up front (call before reporting ready):
+    embedding model load + dummy encode, Mongo connection, tiktoken encoding, Azure clients, the
+    in-process index when RETRIEVAL_BACKEND=local, the BM25 index when HYBRID_SEARCH
+    is on and the cross-encoder when RERANK_ENABLED. Returns seconds spent per step.
+    """
+    timings = {}
+
+    t0 = time.perf_counter()
+    embeddings.warmup()
+    timings["embedding_model"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    retrieval.get_collection().database.client.admin.command("ping")
+    timings["mongo"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    get_encoding()
+    timings["tokenizer"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    llm.get_client()
+    llm.get_async_client()
+    timings["azure_clients"] = time.perf_counter() - t0
+
+    if config.RETRIEVAL_BACKEND == "local":
+        t0 = time.perf_counter()
+        retrieval.get_local_index()
+        timings["local_index"] = time.perf_counter() - t0
+
+    if config.HYBRID_SEARCH:
+        t0 = time.perf_counter()
+        retrieval.get_lexical_index()
+        timings["lexical_index"] = time.perf_counter() - t0
+
+    if config.RERANK_ENABLED:
+        t0 = time.perf_counter()
+        get_reranker().warmup()
+        timings["reranker"] = time.perf_counter() - t0
+
+    print("🔥 Warmup done: " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
+    return timings
+
+
 # =========================
-# 3. Demo
+# 4. Demo
 # =========================
 if __name__ == "__main__":
     demo_q = "Who created Python and when?"
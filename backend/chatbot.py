@@ -1,58 +1,54 @@
 # backend/chatbot.py
 
-from typing import Dict, Any, List
+from typing import Dict, Any
+import config
 from backend.RAG_pipeline import run_rag_pipeline
+from backend.sessions import SessionStore, standalone_query
 
 
 # =========================
 # 1. Conversation Memory
 # =========================
-conversation_history: List[Dict[str, str]] = []  # each entry: {"role": "user"|"assistant", "content": str}
-
-
-def _format_history_for_prompt(history, max_turns=6) -> str:
-    """
-    Format recent conversation history into a string for context.
-    """
-    if not history:
-        return ""
-    snippet = history[-max_turns:]
-    lines = []
-    for h in snippet:
-        prefix = "User:" if h["role"] == "user" else "Assistant:"
-        content = h["content"].strip().replace("\n", " ")
-        lines.append(f"{prefix} {content}")
-    return "\n".join(lines)
+# one bounded session per user / channel id (see backend/sessions.py)
+sessions = SessionStore(
+    max_sessions=config.SESSION_MAX_SESSIONS,
+    ttl_seconds=config.SESSION_TTL_SECONDS,
+    max_chars=config.SESSION_MAX_CHARS,
+    recent_turns=config.SESSION_RECENT_TURNS,
+    summary_chars=config.SESSION_SUMMARY_CHARS,
+)
 
 
 # =========================
 # 2. Chatbot Turn
 # =========================
-def chatbot_turn(user_input: str, debug: bool = False) -> Dict[str, Any]:
+def chatbot_turn(user_input: str, debug: bool = False, session_id: str = "default") -> Dict[str, Any]:
     """
-    Handle one chat turn:
-      - Store user input
-      - Run RAG pipeline
-      - Store assistant reply
+    Handle one chat turn in the session for session_id (a user or channel id):
+      - Build a short standalone query for retrieval (not the whole history)
+      - Run RAG pipeline with the compacted history in the prompt
+      - Store both turns (older turns fold into the session summary)
     Returns structured result from RAG pipeline.
     """
-    global conversation_history
-
-    # 1. Save user turn
-    conversation_history.append({"role": "user", "content": user_input})
+    session = sessions.get(session_id)
 
-    # 2. Add history snippet to enrich question
-    history_snippet = _format_history_for_prompt(conversation_history)
+    # 1. Standalone retrieval query + bounded history for the prompt
+    retrieval_query = standalone_query(user_input, session)
+    history_snippet = session.history_block()
     effective_question = (
         f"Conversation History:\n{history_snippet}\n\nUser question:\n{user_input}"
         if history_snippet else user_input
     )
+    if debug:
+        print(f"🧵 Session {session_id}: retrieval query = {retrieval_query!r}")
 
-    # 3. Run RAG pipeline
-    result = run_rag_pipeline(effective_question, debug=debug)
+    # 2. Run RAG pipeline
+    result = run_rag_pipeline(effective_question, debug=debug, retrieval_query=retrieval_query)
 
-    # 4. Save assistant turn
-    conversation_history.append({"role": "assistant", "content": result["answer"]})
+    # 3. Save both turns, then keep the store within its limits
+    session.add("user", user_input)
+    session.add("assistant", result["answer"])
+    sessions.enforce_limits()
 
     return result
 
@@ -4,23 +4,31 @@ Clean, user-friendly Discord RAG bot (prefix-based).
 Sends only a single tidy answer string back to the user.
 """
 
-import asyncio
 import ast
 import time
-from functools import lru_cache
 import os
 import re
 import discord
 import traceback
 from dotenv import load_dotenv
-from backend.RAG_pipeline import run_rag_pipeline
+import config
+from backend import retrieval
+from backend.embeddings import aembed_query
+from backend.RAG_pipeline import arun_rag_pipeline, warmup
+from backend.semantic_cache import SemanticCache
+from backend.singleflight import AsyncSingleFlight
+from backend.reranker import get_reranker
+from backend.llm import LLM_BUSY
+from backend.llm_scheduler import get_scheduler
 
 # ---------- config ----------
 PREFIXES = ("!ask", "$ask", "/ask")   # commands the bot listens to
-CACHE_SIZE = 128                      # LRU cache size for demo
+STATS_COMMAND = "!ragstats"           # replies with answer-cache stats
 COOLDOWN_SECONDS = 3                  # per-user cooldown (demo-friendly)
 MIN_WORDS = 2                         # ignore tiny messages
 MAX_MESSAGE_CHARS = 1900
+STREAM_PLACEHOLDER = "💭 Thinking…"       # posted immediately, then edited as tokens stream in
+STREAM_EDIT_INTERVAL = 1.2            # seconds between edits (Discord allows ~5 edits / 5s)
 # ----------------------------
 
 # Customize your knowledge domain here
@@ -42,8 +50,24 @@ FALLBACK_RESPONSE = (
     f"- {EXAMPLE_QUERIES[2]}"
 )
 
-# simple in-memory cooldown store (demo use)
+# Reply when the LLM request queue is full (see backend/llm_scheduler.py)
+BUSY_RESPONSE = "⏳ I'm answering a lot of questions right now. Please try again in a moment."
+
+# simple in-memory cooldown store (demo use); entries older than the cooldown are pruned
 _user_cooldowns = {}
+_cooldowns_pruned_at = 0.0
+
+def _check_cooldown(user_id, now: float) -> bool:
+    """True (and start a new cooldown) if the user may ask now; prunes stale entries once a minute."""
+    global _cooldowns_pruned_at
+    if now - _cooldowns_pruned_at > 60:
+        for uid in [u for u, t in _user_cooldowns.items() if now - t >= COOLDOWN_SECONDS]:
+            del _user_cooldowns[uid]
+        _cooldowns_pruned_at = now
+    if now - _user_cooldowns.get(user_id, 0) < COOLDOWN_SECONDS:
+        return False
+    _user_cooldowns[user_id] = now
+    return True
 
 # Load env
 load_dotenv()
@@ -54,11 +78,89 @@ intents = discord.Intents.default()
 intents.message_content = True
 client = discord.Client(intents=intents)
 
-# Cached wrapper around the (blocking) pipeline
-@lru_cache(maxsize=CACHE_SIZE)
-def cached_run_rag_pipeline(question: str):
+# Semantic answer cache: near-duplicate questions reuse a recent answer
+semantic_cache = SemanticCache(
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    max_size=config.SEMANTIC_CACHE_SIZE,
+    ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS,
+    version_check_seconds=config.SEMANTIC_CACHE_VERSION_CHECK_SECONDS,
+)
+
+# Identical questions asked while one is already being answered share that answer
+_question_flight = AsyncSingleFlight()
+_TRAILING_PUNCT = re.compile(r"[\s?!.]+$")
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form used as the coalescing key."""
+    return _TRAILING_PUNCT.sub("", " ".join(question.lower().split()))
+
+# Cached, coalesced wrapper around the async pipeline; runs on the bot's event loop
+async def cached_arun_rag_pipeline(question: str, on_delta=None):
     # returns whatever your pipeline returns (we will robustly extract the answer)
-    return run_rag_pipeline(question)
+    # on_delta only streams for the caller whose run is shared; the others get the final result
+    return await _question_flight.do(normalize_question(question), _cached_answer, question, on_delta)
+
+async def _cached_answer(question: str, on_delta=None):
+    # semantic cache first; on a miss, run the pipeline (streaming via on_delta)
+    if semantic_cache.version_check_due():
+        try:
+            # knowledge base changed since answers were cached -> cache is cleared
+            semantic_cache.set_version(await retrieval.aget_collection_version())
+        except Exception:
+            traceback.print_exc()
+
+    query_vector = await aembed_query(question)
+    cached = semantic_cache.lookup(query_vector)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    result = await arun_rag_pipeline(question, on_delta=on_delta, query_vector=query_vector)
+    answer = result.get("answer", "") if isinstance(result, dict) else ""
+    if not str(answer).startswith(("[LLM_ERROR]", LLM_BUSY)):
+        semantic_cache.store(query_vector, question, result, time.perf_counter() - started)
+    return result
+
+# an unfinished "[source:..." tag at the end of a partial stream
+_INCOMPLETE_TAG = re.compile(r"\s*\[[^\]]*$")
+
+class _ProgressiveReply:
+    """
+    Grows a placeholder message as answer deltas stream in, editing at most once
+    per STREAM_EDIT_INTERVAL, and logs time-to-first-visible-token.
+    """
+
+    def __init__(self, message, started_at: float):
+        self.message = message
+        self.started_at = started_at
+        self.parts = []
+        self.last_edit = 0.0
+        self.first_visible = None
+
+    def _log_first_visible(self, now: float):
+        if self.first_visible is None:
+            self.first_visible = now - self.started_at
+            print(f"⏱️ Time to first visible token: {self.first_visible * 1000:.0f} ms")
+
+    async def on_delta(self, delta: str):
+        self.parts.append(delta)
+        now = time.time()
+        if now - self.last_edit < STREAM_EDIT_INTERVAL:
+            return
+        partial = _clean_answer_text(_INCOMPLETE_TAG.sub("", "".join(self.parts)))
+        if not partial or partial.startswith(LLM_BUSY):
+            return
+        self.last_edit = now
+        try:
+            await self.message.edit(content=partial[:MAX_MESSAGE_CHARS] + " ▌")
+        except discord.HTTPException:
+            return  # skip this frame; the final edit carries the full answer
+        self._log_first_visible(now)
+
+    async def finish(self, text: str):
+        """Replace the streamed text with the final cleaned answer."""
+        await self.message.edit(content=text)
+        self._log_first_visible(time.time())
 
 def _clean_answer_text(s: str) -> str:
     """Remove source tokens and noisy lines, and trim whitespace."""
@@ -90,6 +192,70 @@ def _try_parse_stringified_dict(s: str):
     except Exception:
         return None
 
+def extract_answer_text(result) -> str:
+    """
+    The user-facing reply for a pipeline result (dict, tuple/list or string): the cleaned
+    answer, or BUSY_RESPONSE / FALLBACK_RESPONSE, truncated to MAX_MESSAGE_CHARS.
+    """
+    # --- Robustly extract answer only ---
+    answer = None
+
+    # If pipeline returned a dict
+    if isinstance(result, dict):
+        answer = (result.get("answer")
+                  or result.get("text")
+                  or result.get("response")
+                  or result.get("output")
+                  or result.get("final"))
+    # If pipeline returned tuple/list (common pattern)
+    elif isinstance(result, (tuple, list)):
+        if len(result) >= 1:
+            answer = result[0]
+    # If pipeline returned a string
+    elif isinstance(result, str):
+        answer = result
+    else:
+        # fallback stringify
+        answer = str(result)
+
+    # If 'answer' is still none and result was a string that looks like a dict, try parsing it
+    if answer is None and isinstance(result, str):
+        parsed = _try_parse_stringified_dict(result)
+        if isinstance(parsed, dict):
+            answer = (parsed.get("answer")
+                      or parsed.get("text")
+                      or parsed.get("response")
+                      or parsed.get("output")
+                      or parsed.get("final"))
+
+    # the LLM queue shed this request: say so instead of the out-of-domain fallback
+    if isinstance(answer, str) and answer.startswith(LLM_BUSY):
+        return BUSY_RESPONSE
+
+    # final fallback (also when the pipeline skipped the LLM: nothing relevant retrieved)
+    if answer is None or (isinstance(result, dict) and result.get("out_of_domain")):
+        # Use fallback redirect instead of "I don't know."
+        answer_text = FALLBACK_RESPONSE
+    else:
+        # Clean the answer text (strip source tokens, remove 'Sources:' lines, trim)
+        answer_text = _clean_answer_text(str(answer))
+
+        # Heuristic: treat very short / generic "I don't know" style replies as out-of-context
+        lower_ans = answer_text.lower().strip()
+        weak_responses = {
+            "i don't know", "i don't know.", "i am not sure", "i'm not sure",
+            "no idea", "sorry, i don't know", "i don't have that information"
+        }
+        # if answer is too short or matches weak patterns, replace with FALLBACK_RESPONSE
+        if (len(answer_text) < 5) or (lower_ans in weak_responses):
+            answer_text = FALLBACK_RESPONSE
+
+    # safety truncation
+    if len(answer_text) > MAX_MESSAGE_CHARS:
+        answer_text = answer_text[:MAX_MESSAGE_CHARS] + "\n\n...(truncated)"
+
+    return answer_text
+
 @client.event
 async def on_ready():
     print(f"✅ Logged in as {client.user}")
@@ -106,6 +272,30 @@ async def on_message(message):
     if not content:
         return
 
+    if content.lower() == STATS_COMMAND:
+        stats = semantic_cache.stats()
+        flight = _question_flight.stats()
+        report = (
+            f"📊 Answer cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.0%}), {stats['latency_saved_seconds']:.1f}s saved, "
+            f"{stats['size']}/{stats['max_size']} entries, {stats['invalidations']} invalidations\n"
+            f"🔗 Coalescing: {flight['coalesced']} duplicate in-flight questions shared an answer "
+            f"(pipeline/LLM calls saved), {flight['in_flight']} in flight now"
+        )
+        if config.RERANK_ENABLED:
+            rerank = get_reranker().stats()
+            report += (
+                f"\n🎯 Reranker: {rerank['calls']} calls, {rerank['pairs_scored']} pairs scored, "
+                f"{rerank['cache_hits']} cached, {rerank['over_budget']} over budget"
+            )
+        llm_queue = get_scheduler().stats()
+        report += (
+            f"\n🚦 LLM queue: {llm_queue['queued']}/{llm_queue['max_queue']} waiting, "
+            f"{llm_queue['admitted']} admitted, {llm_queue['shed']} shed (busy), {llm_queue['retries']} retries"
+        )
+        await message.channel.send(report)
+        return
+
     # only handle configured prefixes for demo
     prefix_used = None
     for p in PREFIXES:
@@ -117,12 +307,10 @@ async def on_message(message):
 
     # apply per-user cooldown
     now = time.time()
-    last = _user_cooldowns.get(message.author.id, 0)
-    if now - last < COOLDOWN_SECONDS:
+    if not _check_cooldown(message.author.id, now):
         # gentle rate-limit; avoid spamming LLM and keep demo smooth
         await message.channel.send("Please wait a few seconds before asking again.")
         return
-    _user_cooldowns[message.author.id] = now
 
     # extract question text after prefix
     question = message.content[len(prefix_used):].strip()
@@ -130,74 +318,29 @@ async def on_message(message):
         await message.channel.send(" Please provide a short question (at least a couple of words). E.g. `!ask Who created Python?`")
         return
 
+    reply = None
     try:
-        # typing indicator while we run the pipeline
-        async with message.channel.typing():
-            loop = asyncio.get_running_loop()
-            # run pipeline in background thread; cached wrapper short-circuits repeated queries
-            result = await loop.run_in_executor(None, cached_run_rag_pipeline, question)
-
-        # --- Robustly extract answer only ---
-        answer = None
-
-        # If pipeline returned a dict
-        if isinstance(result, dict):
-            answer = (result.get("answer")
-                      or result.get("text")
-                      or result.get("response")
-                      or result.get("output")
-                      or result.get("final"))
-        # If pipeline returned tuple/list (common pattern)
-        elif isinstance(result, (tuple, list)):
-            if len(result) >= 1:
-                answer = result[0]
-        # If pipeline returned a string
-        elif isinstance(result, str):
-            answer = result
-        else:
-            # fallback stringify
-            answer = str(result)
-
-        # If 'answer' is still none and result was a string that looks like a dict, try parsing it
-        if answer is None and isinstance(result, str):
-            parsed = _try_parse_stringified_dict(result)
-            if isinstance(parsed, dict):
-                answer = (parsed.get("answer")
-                          or parsed.get("text")
-                          or parsed.get("response")
-                          or parsed.get("output")
-                          or parsed.get("final"))
-
-        # final fallback
-        if answer is None:
-            # Use fallback redirect instead of "I don't know."
-            answer_text = FALLBACK_RESPONSE
-        else:
-            # Clean the answer text (strip source tokens, remove 'Sources:' lines, trim)
-            answer_text = _clean_answer_text(str(answer))
-
-            # Heuristic: treat very short / generic "I don't know" style replies as out-of-context
-            lower_ans = answer_text.lower().strip()
-            weak_responses = {
-                "i don't know", "i don't know.", "i am not sure", "i'm not sure",
-                "no idea", "sorry, i don't know", "i don't have that information"
-            }
-            # if answer is too short or matches weak patterns, replace with FALLBACK_RESPONSE
-            if (len(answer_text) < 5) or (lower_ans in weak_responses):
-                answer_text = FALLBACK_RESPONSE
-
-        # safety truncation
-        if len(answer_text) > MAX_MESSAGE_CHARS:
-            answer_text = answer_text[:MAX_MESSAGE_CHARS] + "\n\n...(truncated)"
-
-        # Send only the clean, user-friendly answer
-        await message.channel.send(answer_text)
+        # post a placeholder right away and edit it as the answer streams in
+        reply = _ProgressiveReply(await message.channel.send(STREAM_PLACEHOLDER), started_at=now)
+        # async pipeline: Mongo/Azure awaited on this loop; cached wrapper short-circuits repeated queries
+        result = await cached_arun_rag_pipeline(question, on_delta=reply.on_delta)
+
+        answer_text = extract_answer_text(result)
+
+        # Send only the clean, user-friendly answer (cleanup runs on the completed text)
+        await reply.finish(answer_text)
 
     except Exception as e:
         # terminal-only debug so you can inspect failures during demo
         traceback.print_exc()
         # user-friendly error
-        await message.channel.send("⚠️ Sorry — something went wrong while answering. Check the server logs.")
+        error_text = "⚠️ Sorry — something went wrong while answering. Check the server logs."
+        if reply is not None:
+            await reply.message.edit(content=error_text)
+        else:
+            await message.channel.send(error_text)
 
-# Run the bot
-client.run(TOKEN)
+# Run the bot (after warmup, so the first question doesn't pay for model/client start-up)
+if __name__ == "__main__":
+    warmup()
+    client.run(TOKEN)
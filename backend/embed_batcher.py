@@ -0,0 +1,99 @@
+# backend/embed_batcher.py
+"""
+Micro-batching for query embeddings: single-text requests arriving within a few
+milliseconds of each other are encoded together in one model.encode call.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class EmbeddingBatcher:
+    """
+    Collects submit(text) requests for up to max_wait_ms (or until max_batch are queued),
+    encodes them with one encode_fn(list_of_texts) call and resolves each caller's Future
+    with its own row. Usable from threads (embed) and asyncio (aembed).
+    """
+
+    def __init__(self, encode_fn, max_batch=32, max_wait_ms=5.0, workers=1):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if not self._threads:
+                for i in range(self.workers):
+                    t = threading.Thread(target=self._run, name=f"embed-batcher-{i}", daemon=True)
+                    t.start()
+                    self._threads.append(t)
+
+    def submit(self, text) -> Future:
+        """Queue one text; the Future resolves to its embedding vector."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text):
+        """Blocking single-text embed (thread callers)."""
+        return self.submit(text).result()
+
+    async def aembed(self, text):
+        """Awaitable single-text embed (asyncio callers); the loop is never blocked."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self):
+        """Block for the first request, then gather more until max_batch or the wait window ends."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            live = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            texts = [t for t, _ in live]
+            futures = [f for _, f in live]
+            try:
+                vectors = self.encode_fn(texts)
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            for f, vector in zip(futures, vectors):
+                f.set_result(vector)
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(texts)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "queued": self._queue.qsize(),
+            }
@@ -0,0 +1,284 @@
+# backend/embed_server.py
+"""
+Shared embedding model process: one SentenceTransformer serves encode requests from any
+number of local processes (bot shards, chatbot CLI, evaluation) over a Unix socket, so the
+model is loaded and kept in RAM once per host instead of once per process.
+
+Start it, then point clients at the same socket:
+
+    python -m backend.embed_server                      # socket = config.EMBED_SERVER_SOCKET
+    EMBED_SERVER_SOCKET=/tmp/rag-embed.sock python -m backend.chatbot
+
+Requests from all connections are queued together and encoded in batches of up to
+EMBED_SERVER_MAX_BATCH texts (waiting at most EMBED_SERVER_WAIT_MS for a batch to fill).
+The socket file is created with mode 0600, and both ends authenticate with a shared key
+(see get_authkey) before any message is unpickled, so a client never trusts whoever
+happens to have bound the socket path.
+"""
+
+import argparse
+import os
+import queue
+import secrets
+import signal
+import socket
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import Future
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import config
+
+DEFAULT_SOCKET = "/tmp/rag-embed.sock"
+
+
+def get_authkey(create=False) -> bytes:
+    """
+    The shared handshake key: EMBED_SERVER_AUTHKEY, else the contents of EMBED_SERVER_KEY_FILE
+    (generated with mode 0600 when `create` is set and it doesn't exist yet). A key file that
+    isn't a regular file owned by this user, or that others can read, is refused.
+    """
+    if config.EMBED_SERVER_AUTHKEY:
+        return config.EMBED_SERVER_AUTHKEY.encode("utf-8")
+    path = config.EMBED_SERVER_KEY_FILE
+    if create and not os.path.exists(path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        raise ConnectionError(f"Embedding server key file {path} not found (start the server first)")
+    if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Refusing embedding server key file {path}: must be a 0600 file owned by you")
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip().encode("utf-8")
+
+
+# =========================
+# 1. Server
+# =========================
+class EmbeddingServer:
+    """
+    Accepts connections on `socket_path` (one thread each). Each request is
+    ("encode", [texts]) -> float32 array or ("ping",) -> info dict; failures come back
+    as ("error", message). One encoder thread batches the queued requests.
+    """
+
+    def __init__(self, socket_path, model, max_batch=64, max_wait_ms=2.0, authkey=None):
+        self.socket_path = socket_path
+        self.model = model
+        self.authkey = authkey if authkey is not None else get_authkey(create=True)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self.batches = 0
+        self.texts = 0
+
+    # ---------- batching ----------
+    def _encode_loop(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            pending, count = [first], len(first[0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            texts = [t for item_texts, _ in pending for t in item_texts]
+            try:
+                vectors = np.asarray(self.model.encode(texts, convert_to_numpy=True), dtype=np.float32)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for item_texts, future in pending:
+                future.set_result(vectors[start:start + len(item_texts)])
+                start += len(item_texts)
+
+    def encode(self, texts) -> np.ndarray:
+        if not texts:
+            return np.empty((0, config.EMBED_DIM), dtype=np.float32)
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    # ---------- connections ----------
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if request[0] == "encode":
+                        reply = self.encode(request[1])
+                    elif request[0] == "ping":
+                        reply = {"pid": os.getpid(), "model": config.MODEL_NAME, "backend": config.EMBED_BACKEND,
+                                 "batches": self.batches, "texts": self.texts}
+                    else:
+                        reply = ("error", f"unknown request {request[0]!r}")
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def _remove_stale_socket(self):
+        """
+        Unlink a leftover socket from a previous run. Anything else at the path (a regular
+        file, another user's socket, or a socket a live server is accepting on) is an error.
+        """
+        try:
+            info = os.lstat(self.socket_path)
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+            raise FileExistsError(f"{self.socket_path} exists and is not a socket owned by you")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)  # nobody listening: stale
+            return
+        finally:
+            probe.close()
+        raise FileExistsError(f"An embedding server is already listening on {self.socket_path}")
+
+    def serve_forever(self):
+        self._remove_stale_socket()
+        old_umask = os.umask(0o177)      # socket file created as 0600
+        try:
+            listener = Listener(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(old_umask)
+        bound = os.lstat(self.socket_path).st_ino
+        threading.Thread(target=self._encode_loop, name="embed-server-encoder", daemon=True).start()
+        print(f"✅ Embedding server listening on {self.socket_path} (pid={os.getpid()})")
+        try:
+            with listener:
+                while not self._stop.is_set():
+                    try:
+                        conn = listener.accept()  # runs the authkey handshake
+                    except (multiprocessing.AuthenticationError, EOFError, OSError) as e:
+                        print(f"⚠️ Rejected embedding client: {e}")
+                        continue
+                    threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self._stop.set()
+            try:
+                if os.lstat(self.socket_path).st_ino == bound:  # only remove our own socket
+                    os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+
+# =========================
+# 2. Client
+# =========================
+class EmbeddingClient:
+    """
+    Thread-safe client: keeps a small pool of connections (a Connection isn't safe to share
+    between threads) and reconnects once if the server was restarted. Every connection
+    authenticates the server with `authkey` before the first reply is unpickled.
+    """
+
+    def __init__(self, socket_path, authkey=None):
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _request(self, request):
+        for attempt in range(2):
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    if self.authkey is None:
+                        self.authkey = get_authkey()
+                    conn = Client(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+                conn.send(request)
+                reply = conn.recv()
+            except multiprocessing.AuthenticationError:
+                if conn is not None:
+                    conn.close()
+                raise ConnectionError(f"Embedding server at {self.socket_path} failed authentication")
+            except (EOFError, OSError):
+                if conn is not None:
+                    conn.close()
+                if attempt == 1:
+                    raise ConnectionError(f"Embedding server not reachable at {self.socket_path}")
+                continue
+            with self._lock:
+                self._idle.append(conn)
+            if isinstance(reply, tuple) and reply and reply[0] == "error":
+                raise RuntimeError(f"Embedding server error: {reply[1]}")
+            return reply
+
+    def encode(self, texts) -> np.ndarray:
+        return self._request(("encode", list(texts)))
+
+    def ping(self) -> dict:
+        return self._request(("ping",))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_embed_client():
+    """Shared EmbeddingClient for config.EMBED_SERVER_SOCKET (None when the server is off)."""
+    global _client
+    if not config.EMBED_SERVER_SOCKET:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = EmbeddingClient(config.EMBED_SERVER_SOCKET)
+    return _client
+
+
+# =========================
+# 3. CLI
+# =========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the embedding model to local processes over a Unix socket")
+    parser.add_argument("--socket", default=config.EMBED_SERVER_SOCKET or DEFAULT_SOCKET)
+    parser.add_argument("--max_batch", type=int, default=config.EMBED_SERVER_MAX_BATCH)
+    parser.add_argument("--wait_ms", type=float, default=config.EMBED_SERVER_WAIT_MS)
+    args = parser.parse_args()
+
+    from backend.embeddings import load_model
+    model = load_model()
+    model.encode(["warmup"], convert_to_numpy=True)
+    print(f"✅ Loaded embedding model: {config.MODEL_NAME} (backend={config.EMBED_BACKEND})")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # unwind so the socket file is removed
+    EmbeddingServer(args.socket, model, max_batch=args.max_batch, max_wait_ms=args.wait_ms).serve_forever()
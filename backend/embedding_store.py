@@ -0,0 +1,132 @@
+# backend/embedding_store.py
+"""
+On-disk embedding cache keyed by chunk content hash, so re-ingesting a knowledge base
+only embeds chunks whose text is new or changed.
+Also: encoding of the `embedding` field in MongoDB (BSON array or packed binary vector).
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from bson.binary import VECTOR_SUBTYPE, Binary, BinaryVectorDtype
+import config
+
+
+def content_hash(text: str) -> str:
+    """Stable id for a chunk: sha256 of its exact UTF-8 text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingCache:
+    """
+    SQLite table of (model name, content hash) -> float32 embedding bytes.
+    Vectors from a different model are never returned, so changing MODEL_NAME
+    re-embeds everything without having to delete the file.
+    """
+
+    _SQL_BATCH = 500  # stay well under SQLite's bound-parameter limit
+
+    def __init__(self, path, model_name, dim):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, hashes):
+        """Return {hash: vector} for the hashes that are cached."""
+        found = {}
+        hashes = list(hashes)
+        with self._lock:
+            for start in range(0, len(hashes), self._SQL_BATCH):
+                batch = hashes[start:start + self._SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                )
+                for h, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    if vector.shape[0] == self.dim:
+                        found[h] = vector
+        return found
+
+    def put_many(self, vectors_by_hash):
+        """Store {hash: vector}; existing entries are overwritten."""
+        rows = [
+            (self.model_name, h, np.asarray(v, dtype=np.float32).tobytes())
+            for h, v in vectors_by_hash.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache():
+    """Shared DiskEmbeddingCache at config.EMBED_CACHE_DB, or None if disabled (empty path)."""
+    global _disk_cache
+    if not config.EMBED_CACHE_DB:
+        return None
+    with _disk_cache_lock:
+        if _disk_cache is None:
+            _disk_cache = DiskEmbeddingCache(config.EMBED_CACHE_DB, config.MODEL_NAME, config.EMBED_DIM)
+    return _disk_cache
+
+
+# =========================
+# MongoDB `embedding` field format
+# =========================
+# BSON binary vector (subtype 9): one dtype byte, one padding byte, then the packed values
+_FLOAT32_VECTOR_HEADER = BinaryVectorDtype.FLOAT32.value + b"\x00"
+
+
+def encode_embedding(vector, storage_format=None):
+    """
+    Value to store in the `embedding` field: a list of floats ("array") or a packed
+    little-endian float32 BSON binary vector ("binary"), per config.EMBED_STORAGE_FORMAT.
+    """
+    storage_format = storage_format or config.EMBED_STORAGE_FORMAT
+    vector = np.asarray(vector, dtype="<f4").ravel()
+    if storage_format == "binary":
+        return Binary(_FLOAT32_VECTOR_HEADER + vector.tobytes(), VECTOR_SUBTYPE)
+    if storage_format == "array":
+        return vector.tolist()
+    raise ValueError(f"Unknown EMBED_STORAGE_FORMAT {storage_format!r} (expected array or binary)")
+
+
+def decode_embedding(value) -> np.ndarray:
+    """
+    float32 vector from a stored `embedding` in either format. Binary vectors are read
+    with np.frombuffer (a read-only view, no per-element Python objects).
+    """
+    if isinstance(value, bytes):
+        if value[:2] != _FLOAT32_VECTOR_HEADER:
+            raise ValueError("embedding is not a float32 BSON binary vector")
+        return np.frombuffer(value, dtype="<f4", offset=2)
+    return np.asarray(value, dtype=np.float32)
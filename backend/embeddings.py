@@ -6,28 +6,305 @@ os.environ["MKL_NUM_THREADS"] = "1"
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 
-from sentence_transformers import SentenceTransformer
+import asyncio
+import multiprocessing
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 import config
+from backend.embed_server import get_embed_client
 
 # keep model in memory so it’s not reloaded every call
 _model = None  
+_model_lock = threading.Lock()
+
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8", "torch-int8")
+_ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"  # shipped with the sentence-transformers ONNX exports
+
+
+def load_model(backend=None):
+    """
+    Build a fresh SentenceTransformer for `backend` (default config.EMBED_BACKEND):
+      - "torch":      PyTorch weights as published
+      - "onnx":       ONNX Runtime (needs `pip install sentence-transformers[onnx]`)
+      - "onnx-int8":  ONNX Runtime with the pre-quantized int8 weights file
+      - "torch-int8": PyTorch with nn.Linear layers dynamically quantized to int8
+    Raises ValueError if the model's output size doesn't match config.EMBED_DIM
+    (vectors in MongoDB / the local index would no longer be comparable).
+    """
+    backend = backend or config.EMBED_BACKEND
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND {backend!r} (expected one of {', '.join(EMBED_BACKENDS)})")
+
+    from sentence_transformers import SentenceTransformer
+    if backend in ("onnx", "onnx-int8"):
+        file_name = config.EMBED_ONNX_FILE or (_ONNX_INT8_FILE if backend == "onnx-int8" else "")
+        model_kwargs = {"file_name": file_name} if file_name else None
+        model = SentenceTransformer(config.MODEL_NAME, backend="onnx", model_kwargs=model_kwargs)
+    else:
+        model = SentenceTransformer(config.MODEL_NAME)
+        if backend == "torch-int8":
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    dim = model.get_sentence_embedding_dimension()
+    if dim != config.EMBED_DIM:
+        raise ValueError(f"{config.MODEL_NAME} ({backend}) produces {dim}-d embeddings, but EMBED_DIM={config.EMBED_DIM}")
+    return model
+
 
 def get_model():
-    """load the embedding model."""
+    """load the embedding model (on first use; sentence_transformers/torch are imported here too)."""
     global _model
     if _model is None:
-        _model = SentenceTransformer(config.MODEL_NAME)
-        print(f"✅ Loaded embedding model: {config.MODEL_NAME}")
+        with _model_lock:
+            if _model is None:
+                _model = load_model()
+                print(f"✅ Loaded embedding model: {config.MODEL_NAME} (backend={config.EMBED_BACKEND})")
     return _model
 
 
-def embed_texts(texts):
+def warmup():
+    """Load the model and run one dummy encode so the first real query pays neither."""
+    _encode(["warmup"])
+
+
+_server_retry_at = 0.0  # while the embedding server is unreachable, don't retry it before this
+
+
+def _encode(texts) -> np.ndarray:
+    """
+    Encode with the shared embedding server when EMBED_SERVER_SOCKET is set, else with
+    this process's model. If the server can't be reached, encodes in-process and tries
+    the server again after 30 seconds.
+    """
+    global _server_retry_at
+    client = get_embed_client()
+    if client is not None and time.monotonic() >= _server_retry_at:
+        try:
+            return client.encode(texts)
+        except ConnectionError as e:
+            _server_retry_at = time.monotonic() + 30
+            print(f"⚠️ {e}; encoding in-process")
+    return get_model().encode(texts, convert_to_numpy=True)
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of (model name, normalized text) -> embedding, with optional TTL.
+    Thread-safe; counts hits, misses and evictions (LRU overflow and TTL expiry).
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds  # 0 = entries never expire
+        self._entries = OrderedDict()   # key -> (stored_at, vector)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key):
+        """Like get(), but without touching counters or LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds):
+                return None
+            return entry[1]
+
+    def put(self, key, vector):
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)  # cached rows are shared between callers
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# query embeddings are cached; bulk ingestion passes use_cache=False
+query_cache = EmbeddingCache(config.EMBED_CACHE_SIZE, config.EMBED_CACHE_TTL_SECONDS)
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace (the cache key, and what gets encoded)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embed_texts(texts, use_cache=True):
     """
     Embed a list of texts into vectors.
     Returns a numpy array of shape (n, EMBED_DIM).
+    With use_cache, only texts missing from `query_cache` are encoded (once each, in one
+    batch); results come back in input order.
     """
-    model = get_model()
-    return model.encode(texts, convert_to_numpy=True)
+    if not use_cache or query_cache.max_size <= 0:
+        return _encode(texts)
+    if len(texts) == 0:
+        return np.empty((0, config.EMBED_DIM), dtype=np.float32)
+
+    keys = [(config.MODEL_NAME, normalize_text(t)) for t in texts]
+    found = {}
+    for key in keys:
+        if key not in found:
+            vector = query_cache.get(key)
+            if vector is not None:
+                found[key] = vector
+
+    missing = list(dict.fromkeys(k for k in keys if k not in found))
+    if missing:
+        encoded = _encode([k[1] for k in missing])
+        for key, vector in zip(missing, encoded):
+            query_cache.put(key, vector)
+            found[key] = vector
+
+    return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+
+# =========================
+# Single-query embedding (micro-batched)
+# =========================
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Shared EmbeddingBatcher over embed_texts, started on first use."""
+    global _batcher
+    if _batcher is None:
+        from backend.embed_batcher import EmbeddingBatcher
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher(
+                    embed_texts,
+                    max_batch=config.EMBED_MICROBATCH_MAX_BATCH,
+                    max_wait_ms=config.EMBED_MICROBATCH_WAIT_MS,
+                )
+    return _batcher
+
+
+def _is_cached(text) -> bool:
+    return query_cache.max_size > 0 and query_cache.peek((config.MODEL_NAME, normalize_text(text))) is not None
+
+
+def embed_query(text):
+    """
+    Embed one query. Cached texts return immediately; otherwise, with EMBED_MICROBATCH on,
+    concurrent queries from any thread are encoded together by the shared batcher.
+    """
+    if not config.EMBED_MICROBATCH or _is_cached(text):
+        return embed_texts([text])[0]
+    return get_batcher().embed(text)
+
+
+async def aembed_query(text):
+    """Async embed_query; waits on the batcher (or cpu_executor) without blocking the loop."""
+    if _is_cached(text):
+        return embed_texts([text])[0]
+    if config.EMBED_MICROBATCH:
+        return await get_batcher().aembed(text)
+    return (await run_in_cpu_executor(embed_texts, [text]))[0]
+
+
+# =========================
+# Async access (event-loop callers)
+# =========================
+# Dedicated, bounded pool for CPU-bound work (encoding, in-process index search) so
+# async callers never block the event loop and never queue behind I/O threads.
+cpu_executor = ThreadPoolExecutor(max_workers=config.EMBED_EXECUTOR_WORKERS, thread_name_prefix="embed")
+
+
+async def run_in_cpu_executor(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) on `cpu_executor`."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, lambda: fn(*args, **kwargs))
+
+
+async def aembed_texts(texts, use_cache=True):
+    """
+    Async embed_texts: answered inline when every text is in `query_cache`,
+    otherwise encoded on `cpu_executor`.
+    """
+    if use_cache and query_cache.max_size > 0 and len(texts) > 0 and all(
+        query_cache.peek((config.MODEL_NAME, normalize_text(t))) is not None for t in texts
+    ):
+        return embed_texts(texts)  # all hits: no encode, no thread hop
+    return await run_in_cpu_executor(embed_texts, texts, use_cache=use_cache)
+
+
+# =========================
+# Multi-process encoding (bulk ingestion)
+# =========================
+def _init_encode_worker():
+    """Load this worker process's own model copy once, when the worker starts."""
+    get_model()
+
+
+def _encode_in_worker(texts):
+    return get_model().encode(texts, convert_to_numpy=True)
+
+
+class EncodePool:
+    """
+    Pool of worker processes, each with its own model copy (and one OMP/MKL thread,
+    as pinned at the top of this module), so bulk encoding uses `workers` cores.
+    submit() returns a concurrent.futures.Future of the (n, EMBED_DIM) array.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),  # fresh interpreter, no forked torch state
+            initializer=_init_encode_worker,
+        )
+
+    def submit(self, texts):
+        return self._executor.submit(_encode_in_worker, list(texts))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 # Quick demo 
@@ -0,0 +1,83 @@
+# backend/index_snapshot.py
+"""
+On-disk snapshot of the local vector index: ids and the normalized float32 matrix (or the
+compact codes) as .npy files plus a manifest.json. Opening it with np.load(mmap_mode="r")
+costs O(1) regardless of corpus size, and every process on the host maps the same page-cache
+pages instead of each holding its own copy.
+
+Layout (each save writes a fresh subdirectory, then atomically replaces the manifest, so
+readers never see a half-written snapshot and processes still mapping older files keep
+working). The manifest swap holds an flock on <dir>/.lock and removes only the snapshot the
+previous manifest pointed to, so concurrent savers never delete each other's work:
+
+    <dir>/manifest.json
+    <dir>/<snapshot name>/ids.npy        fixed-width unicode ids
+    <dir>/<snapshot name>/vectors.npy    (n, dim) float32 normalized, or (n, code bytes) uint8
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, manifest swaps are not serialized
+    fcntl = None
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+LOCK = ".lock"
+
+
+def save_snapshot(directory, ids, matrix, meta) -> bool:
+    """
+    Write `ids` + `matrix` with manifest fields `meta` (collection version, count, storage...).
+    Returns False without writing if the ids can't be stored as a plain string array.
+    """
+    if not all(isinstance(_id, str) for _id in ids):
+        print("⚠️ Index snapshot skipped: ids are not all strings")
+        return False
+    name = f"snapshot-{meta.get('collection_version', 0)}-{os.getpid()}-{time.time_ns()}"
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    np.save(os.path.join(path, "ids.npy"), np.asarray(ids, dtype=str) if ids else np.empty(0, dtype="<U1"))
+    np.save(os.path.join(path, "vectors.npy"), np.ascontiguousarray(matrix))
+
+    manifest = dict(meta, format=FORMAT_VERSION, path=name, count=len(ids), created_at=time.time())
+    tmp = os.path.join(directory, f".{MANIFEST}.{name}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    with open(os.path.join(directory, LOCK), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        previous = read_manifest(directory)
+        os.replace(tmp, os.path.join(directory, MANIFEST))
+        # drop only the snapshot we replaced (files still mapped by other processes stay valid
+        # until unmapped); other snapshot-* directories may belong to a save still in progress
+        if previous and previous.get("path", "").startswith("snapshot-") and previous["path"] != name:
+            shutil.rmtree(os.path.join(directory, previous["path"]), ignore_errors=True)
+    return True
+
+
+def read_manifest(directory):
+    """The current manifest dict, or None if there is no (readable) snapshot."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == FORMAT_VERSION else None
+
+
+def load_snapshot(directory, manifest):
+    """Memory-map the snapshot `manifest` points to; returns (ids, matrix), both read-only."""
+    path = os.path.join(directory, manifest["path"])
+    ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+    matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+    if len(ids) != manifest["count"] or matrix.shape[0] != manifest["count"]:
+        raise ValueError(f"Index snapshot {manifest['path']} doesn't match its manifest")
+    return ids, matrix
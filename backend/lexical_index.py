@@ -0,0 +1,116 @@
+# backend/lexical_index.py
+"""
+BM25 inverted index for exact-term matching (identifiers, error strings, command
+names) that MiniLM embeddings match poorly, plus reciprocal rank fusion to merge its
+ranking with the vector search ranking.
+"""
+
+import re
+
+import numpy as np
+
+# identifiers stay whole ("discord.py", "!ragstats", "ModuleNotFoundError", "rate-limit")
+# and are also indexed by their parts ("discord", "py", "rate", "limit")
+_TOKEN_RE = re.compile(r"[!#@]?\w+(?:[.\-/:]\w+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i if in is it me my of on or so that
+the this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased terms of `text`: whole identifiers plus their alphanumeric parts, minus stopwords."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1 or (parts and parts[0] != token):
+            terms.extend(p for p in parts if p not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed corpus, stored as CSR arrays:
+      vocab:    term -> term id
+      offsets:  postings of term t are positions offsets[t]:offsets[t + 1]
+      doc_idx:  int32 document positions
+      weights:  float32 BM25 contribution of the term to that document, precomputed
+                (it doesn't depend on the query), so a query only gathers and sums
+    Rebuilt from the collection whenever it changes, like the vector index.
+    """
+
+    index_type = "bm25"
+
+    def __init__(self, ids, texts, k1=1.2, b=0.75):
+        if len(ids) != len(texts):
+            raise ValueError(f"Got {len(ids)} ids for {len(texts)} texts")
+        self.ids = np.asarray(ids, dtype=object)
+        self.vocab = {}
+        term_ids, doc_positions, counts = [], [], []
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for pos, text in enumerate(texts):
+            tokens = tokenize(text or "")
+            doc_len[pos] = len(tokens)
+            tf = {}
+            for token in tokens:
+                tid = self.vocab.setdefault(token, len(self.vocab))
+                tf[tid] = tf.get(tid, 0) + 1
+            term_ids.extend(tf)
+            doc_positions.extend([pos] * len(tf))
+            counts.extend(tf.values())
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")  # group postings by term, docs ascending
+        self.doc_idx = np.asarray(doc_positions, dtype=np.int32)[order]
+        tf = np.asarray(counts, dtype=np.float32)[order]
+        df = np.bincount(term_ids, minlength=len(self.vocab))
+        self.offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+
+        n = max(len(texts), 1)
+        avg_len = float(doc_len.mean()) if len(texts) else 1.0
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * doc_len[self.doc_idx] / max(avg_len, 1e-9))
+        self.weights = (np.repeat(idf, df) * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.doc_idx.nbytes + self.weights.nbytes)
+
+    def search(self, query_text, top_k=3):
+        """Return (ids, scores) of the top_k BM25 matches, best first (empty if no term matches)."""
+        slices = []
+        for term in set(tokenize(query_text)):
+            tid = self.vocab.get(term)
+            if tid is not None:
+                slices.append(slice(self.offsets[tid], self.offsets[tid + 1]))
+        if not slices or top_k <= 0:
+            return [], []
+        if len(slices) == 1:
+            docs, scores = self.doc_idx[slices[0]], self.weights[slices[0]]
+        else:
+            docs, inverse = np.unique(np.concatenate([self.doc_idx[s] for s in slices]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([self.weights[s] for s in slices]))
+        k = min(top_k, len(docs))
+        top = np.argpartition(scores, len(docs) - k)[len(docs) - k:] if k < len(docs) else np.arange(len(docs))
+        top = top[np.argsort(scores[top])[::-1]]
+        return self.ids[docs[top]].tolist(), scores[top].astype(float).tolist()
+
+
+def reciprocal_rank_fusion(rankings, k=60, top_k=None):
+    """
+    Merge ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in
+    (rank starting at 1). Returns [(id, score)], best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, _id in enumerate(ranking, 1):
+            fused[_id] = fused.get(_id, 0.0) + 1.0 / (k + rank)
+    merged = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return merged[:top_k] if top_k else merged
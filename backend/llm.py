@@ -1,22 +1,64 @@
 # backend/llm.py
 
+import threading
+import time
 import traceback
-from openai import AzureOpenAI
+import asyncio
 import config   # load env vars
+from backend.llm_scheduler import (
+    PRIORITY_BATCH, PRIORITY_INTERACTIVE, SchedulerBusy, estimate_tokens, get_scheduler, is_retryable
+)
 
 # =========================
-# 1. Azure Client Setup
+# 1. Azure Client Setup (lazy: built on first use, not at import)
 # =========================
-try:
-    client = AzureOpenAI(
-        api_key=config.AZURE_OPENAI_KEY,
-        base_url=config.AZURE_OPENAI_ENDPOINT,
-        api_version=config.AZURE_API_VERSION
-    )
-    print(f"✅ Azure OpenAI client initialized (deployment={config.AZURE_DEPLOYMENT_NAME})")
-except Exception as e:
-    print("❌ Failed to initialize Azure client:", str(e))
-    client = None
+client = None        # AzureOpenAI, for the sync pipeline
+async_client = None  # AsyncAzureOpenAI, for arun_rag_pipeline (the Discord bot's event loop)
+_clients_ready = False
+_clients_lock = threading.Lock()
+
+
+def _init_clients():
+    """Create both Azure clients once (thread-safe). A failed client stays None."""
+    global client, async_client, _clients_ready
+    if _clients_ready:
+        return
+    with _clients_lock:
+        if _clients_ready:
+            return
+        from openai import AsyncAzureOpenAI, AzureOpenAI
+        try:
+            client = AzureOpenAI(
+                api_key=config.AZURE_OPENAI_KEY,
+                base_url=config.AZURE_OPENAI_ENDPOINT,
+                api_version=config.AZURE_API_VERSION,
+                max_retries=0  # retried by _send/_asend, which re-queue for rate-limit budget
+            )
+            print(f"✅ Azure OpenAI client initialized (deployment={config.AZURE_DEPLOYMENT_NAME})")
+        except Exception as e:
+            print("❌ Failed to initialize Azure client:", str(e))
+            client = None
+        try:
+            async_client = AsyncAzureOpenAI(
+                api_key=config.AZURE_OPENAI_KEY,
+                base_url=config.AZURE_OPENAI_ENDPOINT,
+                api_version=config.AZURE_API_VERSION,
+                max_retries=0  # retried by _send/_asend, which re-queue for rate-limit budget
+            )
+        except Exception as e:
+            print("❌ Failed to initialize async Azure client:", str(e))
+            async_client = None
+        _clients_ready = True
+
+
+def get_client():
+    _init_clients()
+    return client
+
+
+def get_async_client():
+    _init_clients()
+    return async_client
 
 
 # =========================
@@ -41,10 +83,51 @@ USER_PROMPT_TEMPLATE = (
 # =========================
 # 3. Helper Functions
 # =========================
-def call_azure_chat(system_prompt, user_prompt, max_tokens=350, temperature=0.0, debug=False):
+LLM_BUSY = "[LLM_BUSY]"  # returned (like "[LLM_ERROR] ...") when the request queue sheds the call
+
+
+def _send(create, tokens, priority, debug=False):
+    """
+    Run create() (one Azure request) through the scheduler: wait for RPM/TPM budget, then
+    retry 429s and transient errors with jittered backoff. SchedulerBusy propagates.
+    """
+    scheduler = get_scheduler()
+    for attempt in range(config.LLM_MAX_RETRIES + 1):
+        scheduler.acquire(tokens, priority)
+        try:
+            return create()
+        except Exception as e:
+            if attempt == config.LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = scheduler.backoff_seconds(attempt, e)
+            if debug:
+                print(f"⏳ Azure {type(e).__name__}; retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def _asend(create, tokens, priority, debug=False):
+    """Async _send: create() returns a coroutine; waits happen without blocking the loop."""
+    scheduler = get_scheduler()
+    for attempt in range(config.LLM_MAX_RETRIES + 1):
+        await scheduler.aacquire(tokens, priority)
+        try:
+            return await create()
+        except Exception as e:
+            if attempt == config.LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = scheduler.backoff_seconds(attempt, e)
+            if debug:
+                print(f"⏳ Azure {type(e).__name__}; retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def call_azure_chat(system_prompt, user_prompt, max_tokens=350, temperature=0.0, debug=False,
+                    priority=PRIORITY_BATCH):
     """
     Calls Azure OpenAI chat completion and returns the assistant response.
+    Goes through the rate-limit scheduler; returns "[LLM_BUSY] ..." if the queue is full.
     """
+    client = get_client()
     if not client:
         return "[LLM_ERROR] Azure client not initialized"
 
@@ -59,20 +142,149 @@ def call_azure_chat(system_prompt, user_prompt, max_tokens=350, temperature=0.0,
             print("SYSTEM:", system_prompt[:200])
             print("USER:", user_prompt[:500])
 
-        response = client.chat.completions.create(
-            model=config.AZURE_DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
+        response = _send(
+            lambda: client.chat.completions.create(
+                model=config.AZURE_DEPLOYMENT_NAME,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ),
+            estimate_tokens(system_prompt, user_prompt, max_tokens), priority, debug
         )
 
         return response.choices[0].message.content.strip()
+    except SchedulerBusy as e:
+        return f"{LLM_BUSY} {e}"
     except Exception as e:
         if debug:
             traceback.print_exc()
         return f"[LLM_ERROR] {str(e)}"
 
 
+async def acall_azure_chat(system_prompt, user_prompt, max_tokens=350, temperature=0.0, debug=False,
+                           priority=PRIORITY_INTERACTIVE):
+    """
+    Async version of call_azure_chat (same arguments, same return/error conventions).
+    """
+    async_client = get_async_client()
+    if not async_client:
+        return "[LLM_ERROR] Azure client not initialized"
+
+    try:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+        if debug:
+            print("🟡 Debug - Sending to Azure (async):")
+            print("SYSTEM:", system_prompt[:200])
+            print("USER:", user_prompt[:500])
+
+        response = await _asend(
+            lambda: async_client.chat.completions.create(
+                model=config.AZURE_DEPLOYMENT_NAME,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ),
+            estimate_tokens(system_prompt, user_prompt, max_tokens), priority, debug
+        )
+
+        return response.choices[0].message.content.strip()
+    except SchedulerBusy as e:
+        return f"{LLM_BUSY} {e}"
+    except Exception as e:
+        if debug:
+            traceback.print_exc()
+        return f"[LLM_ERROR] {str(e)}"
+
+
+def stream_azure_chat(system_prompt, user_prompt, max_tokens=350, temperature=0.0, debug=False,
+                      priority=PRIORITY_BATCH):
+    """
+    Streaming call_azure_chat: yields text deltas as Azure produces them.
+    Errors are yielded as a single "[LLM_ERROR] ..." (or "[LLM_BUSY] ...") delta, like
+    call_azure_chat returns them. Only opening the stream is retried, never a partial answer.
+    """
+    client = get_client()
+    if not client:
+        yield "[LLM_ERROR] Azure client not initialized"
+        return
+
+    started = time.perf_counter()
+    first = True
+    try:
+        stream = _send(
+            lambda: client.chat.completions.create(
+                model=config.AZURE_DEPLOYMENT_NAME,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            ),
+            estimate_tokens(system_prompt, user_prompt, max_tokens), priority, debug
+        )
+        for chunk in stream:
+            # Azure sends a leading chunk with no choices (content filter results)
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if first and debug:
+                print(f"⏱️ Azure first token after {(time.perf_counter() - started) * 1000:.0f} ms")
+            first = False
+            yield chunk.choices[0].delta.content
+    except SchedulerBusy as e:
+        yield f"{LLM_BUSY} {e}"
+    except Exception as e:
+        if debug:
+            traceback.print_exc()
+        yield f"[LLM_ERROR] {str(e)}"
+
+
+async def astream_azure_chat(system_prompt, user_prompt, max_tokens=350, temperature=0.0, debug=False,
+                             priority=PRIORITY_INTERACTIVE):
+    """
+    Async stream_azure_chat (async generator of text deltas).
+    """
+    async_client = get_async_client()
+    if not async_client:
+        yield "[LLM_ERROR] Azure client not initialized"
+        return
+
+    started = time.perf_counter()
+    first = True
+    try:
+        stream = await _asend(
+            lambda: async_client.chat.completions.create(
+                model=config.AZURE_DEPLOYMENT_NAME,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            ),
+            estimate_tokens(system_prompt, user_prompt, max_tokens), priority, debug
+        )
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if first and debug:
+                print(f"⏱️ Azure first token after {(time.perf_counter() - started) * 1000:.0f} ms")
+            first = False
+            yield chunk.choices[0].delta.content
+    except SchedulerBusy as e:
+        yield f"{LLM_BUSY} {e}"
+    except Exception as e:
+        if debug:
+            traceback.print_exc()
+        yield f"[LLM_ERROR] {str(e)}"
+
+
 def build_user_prompt(context, question):
     """
     Fills in USER_PROMPT_TEMPLATE with context and question.
@@ -0,0 +1,337 @@
+# backend/llm_scheduler.py
+"""
+Admission control for Azure OpenAI calls: requests-per-minute and tokens-per-minute token
+buckets, a bounded priority queue (interactive Discord questions before batch evaluation),
+fast load shedding when the queue is full, and jittered exponential backoff on 429s.
+
+The buckets live in LLM_BUDGET_FILE, locked by every process on the host (the Discord bot,
+evaluation.py, the chatbot CLI), so together they stay within one deployment quota. The
+priority queue only orders calls inside one process; across processes, batch calls must
+leave LLM_BATCH_RESERVE of each bucket untouched, which only interactive calls may use.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, budgets stay per process
+    fcntl = None
+
+PRIORITY_INTERACTIVE = 0   # Discord users waiting on an answer
+PRIORITY_BATCH = 10        # evaluation runs, scripts
+
+
+class SchedulerBusy(Exception):
+    """The LLM queue is full (or the wait would be too long): reply "busy" instead of queueing."""
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket of `rate_per_minute` units, holding at most `capacity`
+    (default: 10 seconds' worth, since Azure also enforces the quota over short windows).
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(rate_per_minute / 6.0, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now, reserve=0.0) -> float:
+        """
+        Seconds until `amount` can be taken while leaving `reserve` (a fraction of capacity)
+        in the bucket; 0 = now. Amounts above what may be taken count as that maximum.
+        """
+        self._refill(now)
+        floor = reserve * self.capacity
+        missing = min(amount, self.capacity - floor) + floor - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self, amount):
+        self.level = max(self.level - amount, 0.0)
+
+
+class LocalBudget:
+    """RPM + TPM buckets for this process only (0 = unlimited)."""
+
+    def __init__(self, rpm, tpm, batch_reserve=0.0):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.batch_reserve = batch_reserve
+
+    def _try_take(self, tokens, priority, now) -> float:
+        reserve = self.batch_reserve if priority > PRIORITY_INTERACTIVE else 0.0
+        wait = max(
+            self.requests.wait_time(1, now, reserve) if self.requests else 0.0,
+            self.tokens.wait_time(tokens, now, reserve) if self.tokens else 0.0,
+        )
+        if wait == 0:
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+        return wait
+
+    def try_take(self, tokens, priority) -> float:
+        """Take budget for one request now and return 0, or return the seconds to wait."""
+        return self._try_take(tokens, priority, time.monotonic())
+
+
+class SharedBudget(LocalBudget):
+    """
+    The same buckets, with their levels kept in a small JSON file that each try_take reads
+    and updates under an exclusive flock, so all processes on the host draw from one budget.
+    """
+
+    def __init__(self, path, rpm, tpm, batch_reserve=0.0):
+        super().__init__(rpm, tpm, batch_reserve)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def try_take(self, tokens, priority) -> float:
+        buckets = [(name, b) for name, b in (("requests", self.requests), ("tokens", self.tokens)) if b]
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()  # wall clock: shared between processes
+                for name, bucket in buckets:
+                    saved = state.get(name)
+                    if saved and saved.get("capacity") == bucket.capacity:
+                        bucket.level, bucket.updated = saved["level"], min(saved["updated"], now)
+                    else:  # first use, or the limits changed: start full
+                        bucket.level, bucket.updated = bucket.capacity, now
+                wait = self._try_take(tokens, priority, now)
+                if wait == 0:
+                    f.seek(0)
+                    f.truncate()
+                    json.dump({name: {"level": b.level, "updated": b.updated, "capacity": b.capacity}
+                               for name, b in buckets}, f)
+                    f.flush()
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class _Waiter:
+    __slots__ = ("tokens", "event", "loop", "future", "granted", "cancelled", "error")
+
+    def __init__(self, tokens, loop=None):
+        self.tokens = tokens
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+        self.cancelled = False
+        self.error = None
+
+
+class LLMScheduler:
+    """
+    Callers wait in one priority queue (lower priority value first, FIFO within a priority);
+    a dispatcher thread admits the head request as soon as `budget` (a LocalBudget or a
+    SharedBudget) can cover it. Works for threads (acquire) and asyncio tasks (aacquire).
+    The queue is per process; the budget is shared when it is a SharedBudget.
+    """
+
+    def __init__(self, budget=None, max_queue=50, queue_timeout=20.0):
+        self.budget = budget if budget is not None else LocalBudget(360, 60000)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher = None
+        self.admitted = 0
+        self.shed = 0
+        self.retries = 0
+
+    # ---------- queue ----------
+    def _enqueue(self, waiter, priority):
+        with self._cond:
+            queued = sum(1 for _, _, w in self._heap if not w.cancelled)
+            if queued >= self.max_queue:
+                self.shed += 1
+                raise SchedulerBusy(f"LLM queue full ({queued} waiting)")
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="llm-scheduler", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify()
+
+    def _grant(self, waiter):
+        waiter.granted = True
+        self.admitted += 1
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(lambda f=waiter.future: f.done() or f.set_result(None))
+
+    def _fail(self, waiter, error):
+        waiter.granted = True  # settled: _give_up must not count it as shed
+        waiter.error = error
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(lambda f=waiter.future: f.done() or f.set_exception(error))
+
+    def _take_budget(self, waiter, priority):
+        """
+        budget.try_take, surviving its errors: a SharedBudget whose file can't be used is
+        replaced by a process-local budget with the same limits; any other error fails only
+        the head waiter. Returns the seconds to wait, or None if the waiter was failed.
+        """
+        try:
+            return self.budget.try_take(waiter.tokens, priority)
+        except Exception as e:
+            if isinstance(self.budget, SharedBudget):
+                print(f"⚠️ Shared LLM budget {self.budget.path} unusable ({e!r}); using a per-process budget")
+                self.budget = LocalBudget(self.budget.rpm, self.budget.tpm, self.budget.batch_reserve)
+                return self._take_budget(waiter, priority)
+            print(f"⚠️ LLM budget check failed: {e!r}")
+            heapq.heappop(self._heap)
+            self._fail(waiter, e)
+            return None
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                priority, _, waiter = self._heap[0]
+                wait = self._take_budget(waiter, priority)
+                if wait is None:
+                    continue
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._heap)
+                self._grant(waiter)
+
+    def _give_up(self, waiter):
+        """Timed out waiting: withdraw unless the dispatcher admitted us meanwhile."""
+        with self._cond:
+            if waiter.granted:
+                return
+            waiter.cancelled = True
+            self.shed += 1
+        raise SchedulerBusy(f"LLM queue wait exceeded {self.queue_timeout:g}s")
+
+    def acquire(self, tokens, priority=PRIORITY_BATCH):
+        """Block until the request may be sent; raises SchedulerBusy if it can't be soon."""
+        waiter = _Waiter(tokens)
+        self._enqueue(waiter, priority)
+        if not waiter.event.wait(self.queue_timeout):
+            self._give_up(waiter)
+        if waiter.error is not None:
+            raise waiter.error
+
+    async def aacquire(self, tokens, priority=PRIORITY_INTERACTIVE):
+        """Async acquire(): waits without blocking the event loop."""
+        waiter = _Waiter(tokens, loop=asyncio.get_running_loop())
+        self._enqueue(waiter, priority)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._give_up(waiter)
+        except asyncio.CancelledError:
+            with self._cond:
+                waiter.cancelled = True
+            raise
+
+    # ---------- retries ----------
+    def backoff_seconds(self, attempt, error=None) -> float:
+        """Full-jitter exponential backoff; honours a Retry-After header when Azure sends one."""
+        self.retries += 1
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, 0.5)
+        cap = min(config.LLM_BACKOFF_MAX_SECONDS, config.LLM_BACKOFF_BASE_SECONDS * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    def stats(self):
+        with self._cond:
+            queued = sum(1 for _, _, w in self._heap if not w.cancelled)
+        return {"queued": queued, "max_queue": self.max_queue, "admitted": self.admitted,
+                "shed": self.shed, "retries": self.retries}
+
+
+_RETRYABLE_STATUS = {408, 409, 429}
+_RETRYABLE_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+
+def is_retryable(error) -> bool:
+    """429 rate limits plus the transient errors the openai client would itself retry."""
+    status = getattr(error, "status_code", None)
+    if status in _RETRYABLE_STATUS or (status is not None and status >= 500):
+        return True
+    return type(error).__name__ in _RETRYABLE_ERRORS
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value:
+            try:
+                seconds = float(value) / (1000 if name.endswith("ms") else 1)
+            except ValueError:
+                continue
+            return min(seconds, config.LLM_BACKOFF_MAX_SECONDS)
+    return None
+
+
+def estimate_tokens(system_prompt, user_prompt, max_tokens) -> int:
+    """
+    Tokens a request counts against the TPM quota: prompt (~4 characters per token) plus
+    max_tokens, which Azure reserves up front for the completion.
+    """
+    return (len(system_prompt) + len(user_prompt)) // 4 + 8 + max_tokens
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Shared LLMScheduler configured from config (created on first use)."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                if config.LLM_BUDGET_FILE and fcntl is not None:
+                    budget = SharedBudget(config.LLM_BUDGET_FILE, config.AZURE_RPM_LIMIT,
+                                          config.AZURE_TPM_LIMIT, config.LLM_BATCH_RESERVE)
+                else:
+                    budget = LocalBudget(config.AZURE_RPM_LIMIT, config.AZURE_TPM_LIMIT, config.LLM_BATCH_RESERVE)
+                _scheduler = LLMScheduler(
+                    budget,
+                    max_queue=config.LLM_MAX_QUEUE,
+                    queue_timeout=config.LLM_QUEUE_TIMEOUT_SECONDS,
+                )
+    return _scheduler
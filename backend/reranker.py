@@ -0,0 +1,129 @@
+# backend/reranker.py
+"""
+Cross-encoder reranking: score (question, chunk) pairs jointly, which ranks far better
+than comparing independent embeddings, so a wide candidate set can be cut down to the
+few chunks that go into the prompt.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import config
+from backend.embeddings import normalize_text
+
+
+class Reranker:
+    """
+    Batched CrossEncoder scoring with an LRU cache of (normalized question, doc _id) -> score
+    and a per-request time budget. Chunk ids are content hashes, so a cached score stays
+    valid for as long as the chunk exists.
+    """
+
+    def __init__(self, model_name=None, batch_size=16, cache_size=4096):
+        self.model_name = model_name or config.RERANK_MODEL
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.pairs_scored = 0
+        self.over_budget = 0
+
+    def get_model(self):
+        """load the cross-encoder (on first use)."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+                    print(f"✅ Loaded reranker model: {self.model_name}")
+        return self._model
+
+    def warmup(self):
+        self.get_model().predict([("warmup", "warmup")])
+
+    def _cached(self, keys):
+        found = {}
+        with self._cache_lock:
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = score
+        return found
+
+    def _store(self, scores):
+        with self._cache_lock:
+            for key, score in scores.items():
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, question, docs, top_k=3, budget_ms=None):
+        """
+        Return the top_k of `docs` by cross-encoder score (each with "rerank_score").
+        Uncached pairs are scored batch_size at a time; if the budget runs out before every
+        candidate has a score, the docs are returned in their original (retrieval) order.
+        Scores computed before the deadline are still cached for the next request.
+        """
+        budget_ms = config.RERANK_BUDGET_MS if budget_ms is None else budget_ms
+        deadline = time.monotonic() + budget_ms / 1000 if budget_ms > 0 else None
+        self.calls += 1
+        if len(docs) <= 1:
+            return list(docs[:top_k])
+
+        query = normalize_text(question)
+        keys = [(query, d.get("_id")) for d in docs]
+        scores = self._cached(keys)
+        self.cache_hits += len(scores)
+        todo = [i for i, key in enumerate(keys) if key not in scores]
+
+        for start in range(0, len(todo), self.batch_size):
+            if deadline is not None and time.monotonic() > deadline:
+                self.over_budget += 1
+                return list(docs[:top_k])
+            batch = todo[start:start + self.batch_size]
+            predicted = self.get_model().predict([(query, docs[i].get("text", "")) for i in batch],
+                                                 batch_size=self.batch_size)
+            fresh = {keys[i]: float(s) for i, s in zip(batch, np.asarray(predicted).ravel())}
+            self.pairs_scored += len(fresh)
+            self._store(fresh)
+            scores.update(fresh)
+
+        order = sorted(range(len(docs)), key=lambda i: scores[keys[i]], reverse=True)[:top_k]
+        return [dict(docs[i], rerank_score=scores[keys[i]]) for i in order]
+
+    def clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._cache_lock:
+            size = len(self._cache)
+        return {
+            "calls": self.calls,
+            "cache_size": size,
+            "cache_hits": self.cache_hits,
+            "pairs_scored": self.pairs_scored,
+            "over_budget": self.over_budget,
+        }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Shared Reranker configured from config (the model itself loads on first rerank)."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker(config.RERANK_MODEL, config.RERANK_BATCH_SIZE, config.RERANK_CACHE_SIZE)
+    return _reranker
@@ -1,58 +1,430 @@
 # backend/retrieval.py
 import numpy as np
-from pymongo import MongoClient
+from bson import Binary
+from pymongo import AsyncMongoClient, MongoClient, UpdateOne
 import config
-from backend.embeddings import embed_texts  # ensure this exists
+from backend.embeddings import EncodePool, aembed_query, embed_query, embed_texts, run_in_cpu_executor  # ensure this exists
+from backend.embedding_store import content_hash, decode_embedding, encode_embedding, get_disk_cache
+from backend import index_snapshot, vector_index
+from backend.lexical_index import BM25Index, reciprocal_rank_fusion
 import argparse
+import json
+import os
 import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # =========================
-# 1. Connect to MongoDB
+# 1. Connect to MongoDB (lazily: importing this module opens no connections)
 # =========================
-client = MongoClient(config.MONGO_URI)
-db = client[config.MONGO_DB_NAME]
-collection = db[config.MONGO_COLLECTION]
-print(f"✅ Connected to MongoDB: {config.MONGO_DB_NAME}.{config.MONGO_COLLECTION}")
+_collection = None
+_meta_collection = None
+_connect_lock = threading.Lock()
+
+def get_collection():
+    """The chunks collection; the MongoClient is created on first use (thread-safe)."""
+    global _collection, _meta_collection
+    if _collection is None:
+        with _connect_lock:
+            if _collection is None:
+                db = MongoClient(config.MONGO_URI)[config.MONGO_DB_NAME]
+                _meta_collection = db[f"{config.MONGO_COLLECTION}_meta"]
+                _collection = db[config.MONGO_COLLECTION]
+                print(f"✅ Connected to MongoDB: {config.MONGO_DB_NAME}.{config.MONGO_COLLECTION}")
+    return _collection
+
+# knowledge-base version counter, bumped on every write so caches in any process
+# (e.g. the bot's semantic answer cache) can tell the collection changed
+_VERSION_ID = "collection_version"
+
+def get_meta_collection():
+    get_collection()
+    return _meta_collection
+
+def get_collection_version() -> int:
+    doc = get_meta_collection().find_one({"_id": _VERSION_ID})
+    return int(doc["version"]) if doc else 0
+
+async def aget_collection_version() -> int:
+    doc = await get_async_collection().database[f"{config.MONGO_COLLECTION}_meta"].find_one({"_id": _VERSION_ID})
+    return int(doc["version"]) if doc else 0
+
+def _collection_changed():
+    """Call after every write: bump the shared version and drop the in-process index."""
+    get_meta_collection().update_one({"_id": _VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+    invalidate_local_index()
+
+# async client for the event-loop path (arun_rag_pipeline); created on first use,
+# inside the running loop
+_async_collection = None
+
+def get_async_collection():
+    global _async_collection
+    if _async_collection is None:
+        async_client = AsyncMongoClient(config.MONGO_URI)
+        _async_collection = async_client[config.MONGO_DB_NAME][config.MONGO_COLLECTION]
+    return _async_collection
 
 # =========================
 # 2. Helper functions
 # =========================
-def insert_documents(chunks, wipe: bool = False):
+_WRITE_BATCH = 1000  # documents per find($in) / bulk_write round-trip
+
+
+def _existing_sources(ids):
+    """Return {_id: source} for the ids already stored in the collection."""
+    existing = {}
+    for start in range(0, len(ids), _WRITE_BATCH):
+        batch = ids[start:start + _WRITE_BATCH]
+        for d in get_collection().find({"_id": {"$in": batch}}, {"_id": 1, "source": 1}):
+            existing[d["_id"]] = d.get("source")
+    return existing
+
+
+def _normalize_chunks(chunks):
     """
-    Embed texts and insert into MongoDB.
-    :param chunks: list of text strings OR list of dicts with 'text' key
-    :param wipe: if True, will delete existing documents after confirmation (interactive confirmation happens in CLI only)
+    Yield (id, text, source) for text strings or dicts with 'text'/'source' keys.
+    Chunks without a source get one derived from their content hash ("doc_<12 hex>"), so
+    labels stay unique and stable across incremental inserts.
+    """
+    for c in chunks:
+        text = c if isinstance(c, str) else c.get('text')
+        source = None if isinstance(c, str) else c.get('source')
+        _id = content_hash(text)
+        yield _id, text, source or f"doc_{_id[:12]}"
+
+
+# chunks stored before ids became content hashes (ObjectId / integer _id)
+_LEGACY_ID_FILTER = {"_id": {"$not": {"$type": "string"}}}
+
+
+def _plan_batch(batch, replace_legacy=False):
+    """
+    Lookup phase for one batch of (id, text, source); identical texts collapse to one document.
+    Finds which ids are new to the collection and pulls their vectors from the on-disk
+    cache. Returns a plan whose "to_encode" lists the ids that still need the model.
+    With replace_legacy, pre-content-hash documents holding the same texts are listed in
+    "legacy_ids" so the write phase deletes them instead of leaving duplicates.
+    """
+    items = {}
+    for _id, text, source in batch:
+        items.setdefault(_id, (text, source))
+    ids = list(items)
+    legacy_ids = []
+    if replace_legacy:
+        texts = [text for text, _ in items.values()]
+        legacy_ids = [d["_id"] for d in get_collection().find(dict(_LEGACY_ID_FILTER, text={"$in": texts}), {"_id": 1})]
+
+    existing = _existing_sources(ids)
+    new_ids = [_id for _id in ids if _id not in existing]
+    moved_ids = [_id for _id in ids if _id in existing and existing[_id] != items[_id][1]]
+
+    disk_cache = get_disk_cache()
+    vectors = disk_cache.get_many(new_ids) if disk_cache is not None else {}
+    return {
+        "items": items,
+        "ids": ids,
+        "new_ids": new_ids,
+        "moved_ids": moved_ids,
+        "vectors": vectors,
+        "to_encode": [_id for _id in new_ids if _id not in vectors],
+        "legacy_ids": legacy_ids,
+    }
+
+
+def _add_encoded(plan, encoded):
+    """Merge freshly encoded vectors for plan["to_encode"] into the plan and the disk cache."""
+    fresh = {_id: vec for _id, vec in zip(plan["to_encode"], encoded)}
+    disk_cache = get_disk_cache()
+    if disk_cache is not None and fresh:
+        disk_cache.put_many(fresh)
+    plan["vectors"].update(fresh)
+
+
+def _compact_field():
+    """Field holding the VECTOR_STORAGE code (None when storing float32 only)."""
+    if config.VECTOR_STORAGE == "float32":
+        return None
+    if config.VECTOR_STORAGE not in vector_index.COMPACT_STORAGE:
+        raise ValueError(f"Unknown VECTOR_STORAGE {config.VECTOR_STORAGE!r}")
+    return f"embedding_{config.VECTOR_STORAGE}"
+
+
+def _write_batch(plan):
+    """
+    Write phase: bulk upsert new chunks, re-source moved ones and delete the legacy
+    duplicates they replace. Returns per-batch counts.
+    """
+    items, new_ids, moved_ids = plan["items"], plan["new_ids"], plan["moved_ids"]
+    compact_field = _compact_field()
+    codes = {}
+    if compact_field and new_ids:
+        encoded = vector_index.encode_compact([plan["vectors"][_id] for _id in new_ids], config.VECTOR_STORAGE)
+        codes = {_id: Binary(row.tobytes()) for _id, row in zip(new_ids, encoded)}
+
+    ops = []
+    for _id in new_ids:
+        fields = {
+            "text": items[_id][0],
+            "embedding": encode_embedding(plan["vectors"][_id]),
+            "source": items[_id][1],
+        }
+        if compact_field:
+            fields[compact_field] = codes[_id]
+        ops.append(UpdateOne({"_id": _id}, {"$set": fields}, upsert=True))
+    ops += [UpdateOne({"_id": _id}, {"$set": {"source": items[_id][1]}}) for _id in moved_ids]
+    for start in range(0, len(ops), _WRITE_BATCH):
+        get_collection().bulk_write(ops[start:start + _WRITE_BATCH], ordered=False)
+    deleted = 0
+    if plan["legacy_ids"]:
+        deleted = get_collection().delete_many({"_id": {"$in": plan["legacy_ids"]}}).deleted_count
+
+    return {
+        "inserted": len(new_ids),
+        "updated": len(moved_ids),
+        "unchanged": len(plan["ids"]) - len(new_ids) - len(moved_ids),
+        "deleted": deleted,
+        "embedded": len(plan["to_encode"]),
+    }
+
+
+def _delete_missing(keep_ids):
+    """Delete stored chunks whose id is not in keep_ids. Returns the number deleted."""
+    stale = [d["_id"] for d in get_collection().find({}, {"_id": 1}) if d["_id"] not in keep_ids]
+    deleted = 0
+    for start in range(0, len(stale), _WRITE_BATCH):
+        deleted += get_collection().delete_many({"_id": {"$in": stale[start:start + _WRITE_BATCH]}}).deleted_count
+    return deleted
+
+
+def _read_checkpoint(path, label):
+    """Chunks already ingested for `label` according to the checkpoint file (0 if none)."""
+    if not path or not os.path.exists(path):
+        return 0, {}
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("label") != label:
+        print(f"⚠️ Ignoring checkpoint {path}: it belongs to {state.get('label')!r}")
+        return 0, {}
+    return int(state.get("chunks_done", 0)), state.get("totals", {})
+
+
+def _write_checkpoint(path, label, chunks_done, totals):
+    """Atomically record progress (write to a temp file, then rename over the old one)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"label": label, "chunks_done": chunks_done, "totals": totals}, f)
+    os.replace(tmp, path)
+
+
+def ingest_stream(chunks, batch_size=None, checkpoint_path=None, label="stream",
+                  delete_missing: bool = False, workers=None, progress_seconds: float = 5.0):
+    """
+    Streaming ingestion: read chunks -> embed in fixed-size batches -> bulk_write each batch.
+    Only a few batches of texts/embeddings are held at a time, so peak memory is bounded by
+    batch_size (plus the id set when delete_missing is on).
+
+    Stages overlap: while batch N is written to Mongo (writer thread), later batches are
+    already being encoded. With workers > 1 encoding runs in an EncodePool of worker
+    processes (one model copy each); otherwise in one background thread.
+
+    :param chunks: iterable (e.g. a generator) of text strings or dicts with 'text'/'source'
+    :param batch_size: chunks per embed + write round (default config.INGEST_BATCH_SIZE)
+    :param checkpoint_path: JSON file updated after every committed batch. If it exists for the
+        same `label`, the first `chunks_done` chunks are skipped (resume after a crash).
+        Upserts are idempotent, so replaying a partially written batch is harmless.
+        The file is removed once the stream is fully ingested.
+    :param label: identifies the input (e.g. the directory path) so a checkpoint is only
+        reused for the same input
+    :param delete_missing: if True, delete stored chunks not seen in this stream at the end
+    :param workers: encoder processes (default config.INGEST_WORKERS; 1 = in-process)
+    :return: dict of counts (inserted, updated, unchanged, deleted, embedded)
     """
-    # Normalize to texts
-    texts = [c if isinstance(c, str) else c.get('text') for c in chunks]
-    embeddings = embed_texts(texts)  # returns numpy array or list-like
+    batch_size = batch_size or config.INGEST_BATCH_SIZE
+    workers = workers or config.INGEST_WORKERS
+    skip, saved_totals = _read_checkpoint(checkpoint_path, label) if checkpoint_path else (0, {})
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0, "embedded": 0}
+    totals.update(saved_totals)
+    if skip:
+        print(f"↩️ Resuming {label} after {skip} chunks (checkpoint {checkpoint_path})")
+
+    if workers > 1:
+        encoder = EncodePool(workers)
+        encode = encoder.submit
+    else:
+        encoder = ThreadPoolExecutor(max_workers=1)
+        encode = lambda texts: encoder.submit(embed_texts, texts, use_cache=False)
+    writer = ThreadPoolExecutor(max_workers=1)
+
+    seen_ids = set() if delete_missing else None
+    # collections ingested before content-hash ids: replace those documents text by text
+    legacy_count = get_collection().count_documents(_LEGACY_ID_FILTER)
+    if legacy_count:
+        print(f"↪️ {legacy_count} chunks have pre-content-hash ids; each is replaced when its text is "
+              f"re-ingested (ingest with --delete-missing to drop the ones not re-ingested)")
+    pending = deque()      # (plan, encode future, chunks_done after this batch), oldest first
+    last_write = None      # (write future, chunks_done after that batch)
+    done = 0
+    wrote = False
+    t0 = last_report = time.monotonic()
+    batch = []
+
+    def finish_write():
+        """Wait for the in-flight write, then account for it and checkpoint."""
+        nonlocal last_write, wrote, last_report
+        if last_write is None:
+            return
+        future, done_after = last_write
+        last_write = None
+        counts = future.result()
+        for key, value in counts.items():
+            totals[key] += value
+        wrote = wrote or counts["inserted"] or counts["updated"] or counts["deleted"]
+        if checkpoint_path:
+            _write_checkpoint(checkpoint_path, label, done_after, totals)
+        now = time.monotonic()
+        if now - last_report >= progress_seconds:
+            rate = (done_after - skip) / max(now - t0, 1e-9)
+            print(f"⏳ {label}: {done_after} chunks ({rate:.0f} chunks/s) {totals}")
+            last_report = now
+
+    def drain_one():
+        """Hand the oldest encoded batch to the writer (after the previous write lands)."""
+        nonlocal last_write
+        plan, future, done_after = pending.popleft()
+        if future is not None:
+            _add_encoded(plan, future.result())
+        finish_write()
+        last_write = (writer.submit(_write_batch, plan), done_after)
+
+    def submit_batch():
+        plan = _plan_batch(batch, replace_legacy=legacy_count > 0)
+        texts = [plan["items"][_id][0] for _id in plan["to_encode"]]
+        pending.append((plan, encode(texts) if texts else None, done))
+        batch.clear()
+        while len(pending) > workers:
+            drain_one()
+
+    try:
+        for item in _normalize_chunks(chunks):
+            done += 1
+            if seen_ids is not None:
+                seen_ids.add(item[0])
+            if done <= skip:
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                submit_batch()
+        if batch:
+            submit_batch()
+        while pending:
+            drain_one()
+        finish_write()
+
+        if delete_missing:
+            totals["deleted"] += _delete_missing(seen_ids)
+            wrote = wrote or totals["deleted"]
+    finally:
+        writer.shutdown(wait=True)
+        if workers > 1:
+            encoder.close()
+        else:
+            encoder.shutdown(wait=True)
+        if wrote:
+            _collection_changed()
 
-    documents_to_insert = []
-    for i, (text, emb) in enumerate(zip(texts, embeddings)):
-        documents_to_insert.append({
-            "_id": i,
-            "text": text,
-            "embedding": np.asarray(emb).tolist(),
-            "source": f"doc_{i+1}"
-        })
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"✅ Ingested {label}: {done} chunks in {time.monotonic() - t0:.1f}s {totals}")
+    return totals
 
+
+def migrate_embedding_format(target=None, batch_size=None):
+    """
+    Rewrite stored `embedding` fields in place to `target` format ("binary" or "array",
+    default config.EMBED_STORAGE_FORMAT), batch_size documents per bulk_write.
+    Only documents still in the other format are touched, so an interrupted migration
+    can simply be re-run. Vector values are unchanged (float32 either way), so indexes
+    and caches stay valid. Returns the number of documents converted.
+    """
+    target = target or config.EMBED_STORAGE_FORMAT
+    batch_size = batch_size or _WRITE_BATCH
+    source_type = {"binary": "array", "array": "binData"}[target]
+    query = {"embedding": {"$type": source_type}}
+    remaining = get_collection().count_documents(query)
+    converted = 0
+    t0 = time.monotonic()
+    while True:
+        docs = list(get_collection().find(query, {"_id": 1, "embedding": 1}).limit(batch_size))
+        if not docs:
+            break
+        ops = [
+            UpdateOne({"_id": d["_id"]}, {"$set": {"embedding": encode_embedding(decode_embedding(d["embedding"]), target)}})
+            for d in docs
+        ]
+        get_collection().bulk_write(ops, ordered=False)
+        converted += len(docs)
+        print(f"⏳ Migrated {converted}/{remaining} embeddings to {target}")
+    print(f"✅ Migrated {converted} embeddings to {target} in {time.monotonic() - t0:.1f}s")
+    return converted
+
+
+def iter_chunks_from_dir(path, chunk_size=None, chunk_overlap=None, extensions=(".txt", ".md")):
+    """
+    Yield {"text", "source"} chunks for every matching file under `path`, one file at a time.
+    Files are visited in sorted order so checkpoints can resume deterministically.
+    Uses the notebook's RecursiveCharacterTextSplitter settings (CHUNK_SIZE / CHUNK_OVERLAP).
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or config.CHUNK_SIZE,
+        chunk_overlap=chunk_overlap if chunk_overlap is not None else config.CHUNK_OVERLAP,
+        separators=["\n\n", "\n", ". ", ".", " "],
+    )
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(tuple(extensions)):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            source = os.path.relpath(file_path, path)
+            for chunk in splitter.split_text(text):
+                yield {"text": chunk, "source": source}
+
+
+def insert_documents(chunks, wipe: bool = False, delete_missing: bool = False):
+    """
+    Embed texts and upsert into MongoDB, keyed by content hash.
+    Only chunks that are new to the collection are embedded (or read from the on-disk
+    embedding cache); unchanged chunks are skipped, so re-running is idempotent.
+    :param chunks: list of text strings OR list of dicts with 'text' (and optional 'source') keys
+    :param wipe: if True, will delete existing documents after confirmation (interactive confirmation happens in CLI only)
+    :param delete_missing: if True, delete stored chunks that are not in `chunks`
+    :return: dict of counts (inserted, updated, unchanged, deleted, embedded)
+    """
     if wipe:
         # When called programmatically, avoid interactive confirmation here.
         # CLI will pass wipe=True only after confirmation.
-        collection.delete_many({})  # actual wipe
+        get_collection().delete_many({})  # actual wipe
+        _collection_changed()
         print("⚠️ Collection wiped (delete_many executed).")
 
-    # Insert documents
-    if len(documents_to_insert) > 0:
-        collection.insert_many(documents_to_insert)
-        print(f"✅ Inserted {len(documents_to_insert)} documents into MongoDB.")
-    else:
-        print("No documents to insert.")
+    return ingest_stream(chunks, label="insert_documents", delete_missing=delete_missing)
+
+def mongodb_vector_search(query_text, top_k=3, query_vector=None):
+    """ Atlas Vector Search using $vectorSearch. Pass query_vector to skip re-embedding. """
+    if query_vector is None:
+        query_vector = embed_query(query_text)
+    return list(get_collection().aggregate(_vector_search_pipeline(query_vector, top_k)))
 
-def mongodb_vector_search(query_text, top_k=3):
-    """ Atlas Vector Search using $vectorSearch. """
-    q_emb = embed_texts([query_text])[0].tolist()
-    pipeline = [
+def _vector_search_pipeline(query_vector, top_k):
+    q_emb = np.asarray(query_vector, dtype=np.float32).tolist()
+    return [
         {"$vectorSearch": {
             "index": config.INDEX_NAME,
             "path": "embedding",
@@ -62,19 +434,577 @@ def mongodb_vector_search(query_text, top_k=3):
         }},
         {"$project": {"_id": 1, "text": 1, "source": 1, "score": {"$meta": "vectorSearchScore"}}}
     ]
-    return list(collection.aggregate(pipeline))
-
-def fallback_search(query_text, top_k=3):
-    """ Manual cosine similarity fallback if Atlas $vectorSearch not available. """
-    q_emb = np.asarray(embed_texts([query_text])[0], dtype=np.float32)
-    qnorm = np.linalg.norm(q_emb)
-    sims = []
-    for d in collection.find({}, {"_id": 1, "text": 1, "source": 1, "embedding": 1}):
-        d_emb = np.asarray(d["embedding"], dtype=np.float32)
-        denom = qnorm * np.linalg.norm(d_emb)
-        score = float(np.dot(q_emb, d_emb) / denom) if denom != 0 else 0.0
-        sims.append({"_id": d["_id"], "text": d["text"], "source": d["source"], "score": score})
-    return sorted(sims, key=lambda x: x["score"], reverse=True)[:top_k]
+
+def fallback_search(query_text, top_k=3, query_vector=None):
+    """
+    Cosine similarity fallback if Atlas $vectorSearch not available.
+    Searches the cached in-process index (FAISS, or a NumPy matrix without faiss)
+    and fetches text only for the top_k results.
+    """
+    return local_index_search(query_text, top_k=top_k, query_vector=query_vector)
+
+# =========================
+# 3. Local in-process index
+# =========================
+# Two phases: the index holds only ids + vectors (scoring), and text/source are fetched
+# for the top_k winners only (hydration), through `doc_cache`.
+_local_index = None   # index built from every stored embedding; see get_local_index()
+_lexical_index = None  # BM25 over every chunk's text (hybrid search); see get_lexical_index()
+_local_index_generation = 0  # bumped on every invalidation so stale rebuilds are discarded
+_local_index_lock = threading.Lock()
+_indexed_version = None      # collection version the indexes reflect (None = read before next build)
+_version_checked_at = 0.0
+
+
+def _snapshot_meta(version):
+    """Manifest fields an index snapshot must match to be used for this collection/config."""
+    return {
+        "collection": f"{config.MONGO_DB_NAME}.{config.MONGO_COLLECTION}",
+        "collection_version": version,
+        "storage": config.VECTOR_STORAGE if _compact_field() else "float32",
+        "dim": config.EMBED_DIM,
+    }
+
+
+def build_local_index():
+    """
+    Read every stored embedding from the collection once and build the configured index.
+    Only _id and the vector field are read: no chunk text is transferred or held in memory.
+    With compact VECTOR_STORAGE only the codes are read (and held in memory); chunks
+    stored before compact storage was enabled are encoded from their float32 embedding.
+    With INDEX_SNAPSHOT_DIR set, the ids and normalized vectors (or codes) are also saved
+    there for load_local_index_snapshot().
+    """
+    # read the version before scanning: a write during the scan leaves the snapshot stale, not wrong
+    version = get_collection_version() if config.INDEX_SNAPSHOT_DIR else None
+    compact_field = _compact_field()
+    vector_field = compact_field or "embedding"
+    ids, vectors, missing = [], [], []
+    for d in get_collection().find({}, {"_id": 1, vector_field: 1}):
+        if vector_field not in d:
+            missing.append(d["_id"])
+            continue
+        ids.append(d["_id"])
+        vectors.append(np.frombuffer(d[vector_field], dtype=np.uint8) if compact_field else decode_embedding(d["embedding"]))
+
+    if compact_field:
+        code_bytes = vector_index.code_size(config.VECTOR_STORAGE, config.EMBED_DIM)
+        codes = np.stack(vectors) if vectors else np.empty((0, code_bytes), dtype=np.uint8)
+        if missing:
+            fetched = fetch_embeddings(missing)
+            ids += list(fetched)
+            codes = np.vstack([codes, vector_index.encode_compact(list(fetched.values()), config.VECTOR_STORAGE)])
+        matrix = codes
+        index = vector_index.QuantizedIndex(
+            ids, codes, config.VECTOR_STORAGE, config.EMBED_DIM,
+            fetch_vectors=fetch_embeddings,
+            oversample=config.VECTOR_RESCORE_OVERSAMPLE,
+        )
+    else:
+        vectors = np.stack(vectors) if vectors else np.empty((0, config.EMBED_DIM), dtype=np.float32)
+        matrix = vector_index.normalize_rows(vectors)
+        index = vector_index.build_index(
+            ids, matrix,
+            index_type=config.LOCAL_INDEX_TYPE,
+            nlist=config.FAISS_NLIST,
+            nprobe=config.FAISS_NPROBE,
+            hnsw_m=config.FAISS_HNSW_M,
+            ef_search=config.FAISS_HNSW_EF_SEARCH,
+        )
+    print(f"✅ Built local {index.index_type} index over {len(ids)} documents")
+
+    if config.INDEX_SNAPSHOT_DIR and ids:
+        # the snapshot only speeds up the next start: failing to write it must not lose this index
+        try:
+            os.makedirs(config.INDEX_SNAPSHOT_DIR, exist_ok=True)
+            if index_snapshot.save_snapshot(config.INDEX_SNAPSHOT_DIR, ids, matrix, _snapshot_meta(version)):
+                print(f"💾 Saved index snapshot to {config.INDEX_SNAPSHOT_DIR} (collection version {version})")
+        except OSError as e:
+            print(f"⚠️ Could not save index snapshot to {config.INDEX_SNAPSHOT_DIR}: {e}")
+    return index
+
+
+def load_local_index_snapshot():
+    """
+    Open the index snapshot in INDEX_SNAPSHOT_DIR memory-mapped, if it is current: same
+    collection, storage and dimension, same collection version and document count.
+    Returns None (caller rebuilds) if snapshots are off, missing, stale or unreadable.
+    "flat"/"numpy" and compact indexes search the mapped arrays directly; "ivf"/"hnsw"
+    rebuild their graph/lists from the snapshot vectors (still without a collection scan).
+    """
+    if not config.INDEX_SNAPSHOT_DIR:
+        return None
+    manifest = index_snapshot.read_manifest(config.INDEX_SNAPSHOT_DIR)
+    if manifest is None:
+        return None
+    expected = _snapshot_meta(get_collection_version())
+    stale = [key for key, value in expected.items() if manifest.get(key) != value]
+    if not stale and manifest["count"] != get_collection().estimated_document_count():
+        stale = ["count"]
+    if stale:
+        print(f"♻️ Index snapshot {manifest['path']} is stale ({', '.join(stale)} changed); rebuilding")
+        return None
+    try:
+        ids, matrix = index_snapshot.load_snapshot(config.INDEX_SNAPSHOT_DIR, manifest)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not load index snapshot: {e}; rebuilding")
+        return None
+
+    if expected["storage"] != "float32":
+        index = vector_index.QuantizedIndex(
+            ids, matrix, config.VECTOR_STORAGE, config.EMBED_DIM,
+            fetch_vectors=fetch_embeddings,
+            oversample=config.VECTOR_RESCORE_OVERSAMPLE,
+        )
+    elif config.LOCAL_INDEX_TYPE in ("flat", "numpy"):
+        index = vector_index.MatrixIndex.from_normalized(ids, matrix)  # exact, like IndexFlatIP
+    else:
+        index = vector_index.build_index(
+            ids, matrix,
+            index_type=config.LOCAL_INDEX_TYPE,
+            nlist=config.FAISS_NLIST,
+            nprobe=config.FAISS_NPROBE,
+            hnsw_m=config.FAISS_HNSW_M,
+            ef_search=config.FAISS_HNSW_EF_SEARCH,
+        )
+    print(f"✅ Loaded local {index.index_type} index over {len(ids)} documents from snapshot "
+          f"(collection version {manifest['collection_version']})")
+    return index
+
+
+def fetch_embeddings(ids):
+    """Return {_id: float32 embedding} for the given ids (one $in query per _WRITE_BATCH ids)."""
+    found = {}
+    ids = list(ids)
+    for start in range(0, len(ids), _WRITE_BATCH):
+        for d in get_collection().find({"_id": {"$in": ids[start:start + _WRITE_BATCH]}}, {"_id": 1, "embedding": 1}):
+            found[d["_id"]] = decode_embedding(d["embedding"])
+    return found
+
+
+class DocumentCache:
+    """
+    Thread-safe LRU of _id -> {"text", "source"} for hydrated chunks.
+    Ids are content hashes, so text never changes under an id; the cache is still cleared
+    on every collection write because sources can be reassigned and chunks deleted.
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, ids):
+        """Return {_id: doc} for the cached ids (marking them recently used)."""
+        found = {}
+        with self._lock:
+            for _id in ids:
+                doc = self._entries.get(_id)
+                if doc is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(_id)
+                self.hits += 1
+                found[_id] = doc
+        return found
+
+    def put_many(self, docs):
+        with self._lock:
+            for _id, doc in docs.items():
+                self._entries[_id] = doc
+                self._entries.move_to_end(_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+doc_cache = DocumentCache(config.DOC_CACHE_SIZE)
+
+
+def hydrate(ids):
+    """
+    Return {_id: {"text", "source"}} for `ids`: cached docs first, then one
+    find({"_id": {"$in": ...}}) for the rest. Ids no longer in the collection are omitted.
+    """
+    docs = doc_cache.get_many(ids)
+    missing = [_id for _id in ids if _id not in docs]
+    if missing:
+        generation = _local_index_generation
+        fetched = {
+            d["_id"]: _hydrated_fields(d)
+            for d in get_collection().find({"_id": {"$in": missing}}, {"_id": 1, "text": 1, "source": 1})
+        }
+        _cache_hydrated(fetched, generation)
+        docs.update(fetched)
+    return docs
+
+
+async def ahydrate(ids):
+    """ Async hydrate(): the $in query for uncached ids is awaited on the AsyncMongoClient. """
+    docs = doc_cache.get_many(ids)
+    missing = [_id for _id in ids if _id not in docs]
+    if missing:
+        generation = _local_index_generation
+        cursor = get_async_collection().find({"_id": {"$in": missing}}, {"_id": 1, "text": 1, "source": 1})
+        fetched = {d["_id"]: _hydrated_fields(d) async for d in cursor}
+        _cache_hydrated(fetched, generation)
+        docs.update(fetched)
+    return docs
+
+
+def _hydrated_fields(d):
+    return {"text": d.get("text", ""), "source": d.get("source") or f"doc_{d['_id']}"}
+
+
+def _cache_hydrated(fetched, generation):
+    if generation == _local_index_generation:  # don't cache docs read across a write
+        doc_cache.put_many(fetched)
+
+
+def build_lexical_index():
+    """
+    Read every chunk's text once and build the BM25 index (hybrid search).
+    Only the postings are kept; the text itself is not held in memory.
+    """
+    ids, texts = [], []
+    for d in get_collection().find({}, {"_id": 1, "text": 1}):
+        ids.append(d["_id"])
+        texts.append(d.get("text", ""))
+    index = BM25Index(ids, texts)
+    print(f"✅ Built local bm25 index over {len(ids)} documents ({len(index.vocab)} terms, {index.nbytes / 1e6:.1f} MB)")
+    return index
+
+
+def _check_collection_version():
+    """
+    At most once per LOCAL_INDEX_VERSION_CHECK_SECONDS, compare the collection version with
+    the one the in-process indexes reflect. Writes from other processes (ingestion runs) bump
+    it; the indexes are then dropped and the next query rebuilds them.
+    """
+    if _version_check_due():
+        _note_collection_version(get_collection_version())
+
+
+async def acheck_collection_version():
+    """ Async _check_collection_version(): the version is read on the AsyncMongoClient. """
+    if _version_check_due():
+        _note_collection_version(await aget_collection_version())
+
+
+def _version_check_due() -> bool:
+    global _version_checked_at
+    now = time.monotonic()
+    if now - _version_checked_at < config.LOCAL_INDEX_VERSION_CHECK_SECONDS:
+        return False
+    _version_checked_at = now
+    return True
+
+
+def _note_collection_version(version):
+    global _indexed_version
+    if _indexed_version is not None and version != _indexed_version:
+        print(f"♻️ Collection version {_indexed_version} -> {version}: rebuilding local indexes")
+        invalidate_local_index()
+    _indexed_version = version
+
+
+def get_local_index(check_version=True):
+    """
+    Return the local index: from a current snapshot, else built on first use (thread-safe).
+    check_version=False skips the collection version check (async callers await it first).
+    """
+    global _local_index
+    if check_version:
+        _check_collection_version()
+    current = _local_index
+    if current is not None:
+        return current
+    with _local_index_lock:
+        if _local_index is None:
+            index = load_local_index_snapshot()
+            _local_index = index if index is not None else build_local_index()
+        return _local_index
+
+
+def get_lexical_index(check_version=True):
+    """Return the BM25 index, building it on first use (thread-safe)."""
+    global _lexical_index
+    if check_version:
+        _check_collection_version()
+    current = _lexical_index
+    if current is not None:
+        return current
+    with _local_index_lock:
+        if _lexical_index is None:
+            _lexical_index = build_lexical_index()
+        return _lexical_index
+
+
+def invalidate_local_index():
+    """
+    Drop the in-process indexes (and hydrated docs) so the next query rebuilds from the collection.
+    Call after every write: once this returns, no query can see pre-write results.
+    """
+    global _local_index, _lexical_index, _local_index_generation, _indexed_version, _version_checked_at
+    with _local_index_lock:
+        _local_index_generation += 1
+        _local_index = None
+        _lexical_index = None
+        # re-read the version before the next build, so this write isn't seen as a new one
+        _indexed_version = None
+        _version_checked_at = 0.0
+    doc_cache.clear()
+
+
+def refresh_local_index() -> bool:
+    """
+    Rebuild the indexes now and swap them in; queries keep using the old ones meanwhile.
+    Returns False (and discards the rebuild) if a write invalidated the index while building.
+    """
+    global _local_index, _lexical_index
+    with _local_index_lock:
+        generation = _local_index_generation
+    rebuilt = build_local_index()
+    lexical = build_lexical_index() if config.HYBRID_SEARCH else None
+    with _local_index_lock:
+        if generation != _local_index_generation:
+            return False
+        _local_index = rebuilt
+        _lexical_index = lexical
+        return True
+
+
+def local_index_search(query_text, top_k=3, query_vector=None):
+    """
+    Score on the in-process index (no Mongo round-trip once built), then hydrate
+    text/source for just the top_k hits.
+    """
+    index = get_local_index()
+    if query_vector is None:
+        query_vector = embed_query(query_text)
+    ids, scores = index.search(query_vector, top_k=top_k)
+    return _scored_docs(ids, scores, hydrate(ids))
+
+
+async def alocal_index_search(query_text, top_k=3, query_vector=None):
+    """
+    Async local_index_search(): the version check and hydration are awaited on the
+    AsyncMongoClient; only the index search runs on the CPU executor.
+    """
+    await acheck_collection_version()
+    if query_vector is None:
+        query_vector = await aembed_query(query_text)
+    ids, scores = await run_in_cpu_executor(
+        lambda: get_local_index(check_version=False).search(query_vector, top_k=top_k)
+    )
+    return _scored_docs(ids, scores, await ahydrate(ids))
+
+
+def _scored_docs(ids, scores, docs):
+    return [
+        {"_id": _id, "text": docs[_id]["text"], "source": docs[_id]["source"], "score": score}
+        for _id, score in zip(ids, scores)
+        if _id in docs
+    ]
+
+
+# =========================
+# 4. Search entry point (Atlas circuit breaker)
+# =========================
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for `cooldown_seconds` after `failure_threshold`
+    consecutive failures. After the cooldown one trial call is let through: success
+    closes the breaker, failure re-opens it for another cooldown.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown_seconds=60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True if the protected call should be attempted now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown_seconds:
+                # half-open: let one trial through, block the rest until it reports back
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+atlas_breaker = CircuitBreaker(config.ATLAS_FAILURE_THRESHOLD, config.ATLAS_COOLDOWN_SECONDS)
+
+
+def lexical_search(query_text, top_k=3, check_version=True):
+    """ BM25 search on the in-process inverted index; returns [{"_id", "score"}], best first. """
+    ids, scores = get_lexical_index(check_version).search(query_text, top_k=top_k)
+    return [{"_id": _id, "score": score} for _id, score in zip(ids, scores)]
+
+
+def hybrid_merge(query_text, vector_docs, top_k=3):
+    """
+    Fuse vector results with BM25 results by reciprocal rank fusion (k = RRF_K).
+    Each doc keeps its vector_score / lexical_score; "score" becomes the fused score.
+    Docs found only lexically are hydrated (one $in query for those ids).
+    """
+    fusion = _fuse_lexical(query_text, vector_docs, top_k)
+    if fusion is None:
+        return vector_docs[:top_k]
+    missing = [_id for _id, _ in fusion[0] if _id not in fusion[1]]
+    return _fused_docs(*fusion, hydrate(missing) if missing else {})
+
+
+async def ahybrid_merge(query_text, vector_docs, top_k=3):
+    """
+    Async hybrid_merge(): BM25 and the fusion run on the CPU executor, the version check
+    and hydration of lexical-only hits are awaited on the AsyncMongoClient.
+    """
+    await acheck_collection_version()
+    fusion = await run_in_cpu_executor(_fuse_lexical, query_text, vector_docs, top_k, check_version=False)
+    if fusion is None:
+        return vector_docs[:top_k]
+    missing = [_id for _id, _ in fusion[0] if _id not in fusion[1]]
+    return _fused_docs(*fusion, await ahydrate(missing) if missing else {})
+
+
+def _fuse_lexical(query_text, vector_docs, top_k, check_version=True):
+    """
+    The CPU half of hybrid_merge: returns (fused [(_id, score)], vector docs by _id,
+    {_id: BM25 score}), or None if BM25 found nothing.
+    """
+    lexical = lexical_search(query_text, top_k=max(top_k, config.HYBRID_CANDIDATES), check_version=check_version)
+    if not lexical:
+        return None
+
+    by_id = {d["_id"]: dict(d, lexical_score=None) for d in vector_docs}
+    for hit in lexical:
+        if hit["_id"] in by_id:
+            by_id[hit["_id"]]["lexical_score"] = hit["score"]
+    fused = reciprocal_rank_fusion(
+        [[d["_id"] for d in vector_docs], [hit["_id"] for hit in lexical]], k=config.RRF_K, top_k=top_k,
+    )
+    return fused, by_id, {hit["_id"]: hit["score"] for hit in lexical}
+
+
+def _fused_docs(fused, by_id, lexical_scores, hydrated):
+    """ Fused docs best first; lexical-only hits come from `hydrated` ({_id: {"text", "source"}}). """
+    for _id, doc in hydrated.items():
+        by_id[_id] = {"_id": _id, **doc, "vector_score": None, "lexical_score": lexical_scores[_id]}
+    return [dict(by_id[_id], score=score) for _id, score in fused if _id in by_id]
+
+
+def _with_vector_scores(docs, atlas: bool):
+    """
+    Set "vector_score" = cosine similarity on every doc, whichever path found it, so
+    callers can compare scores against one threshold (RETRIEVAL_MIN_SCORE).
+    Atlas reports (1 + cosine) / 2 for a cosine index; the local index reports cosine.
+    """
+    for d in docs:
+        score = d.get("score")
+        d["vector_score"] = None if score is None else (2 * score - 1 if atlas else score)
+    return docs
+
+
+def _vector_search(query_text, top_k, query_vector):
+    if config.RETRIEVAL_BACKEND != "local" and atlas_breaker.allow():
+        try:
+            docs = mongodb_vector_search(query_text, top_k=top_k, query_vector=query_vector)
+            if not docs:
+                raise RuntimeError("Atlas returned no results")
+            atlas_breaker.record_success()
+            return _with_vector_scores(docs, atlas=True)
+        except Exception:
+            atlas_breaker.record_failure()
+
+    return _with_vector_scores(fallback_search(query_text, top_k=top_k, query_vector=query_vector), atlas=False)
+
+
+def search(query_text, top_k=3, query_vector=None):
+    """
+    Retrieve the top_k docs for a query, embedding it at most once.
+      - RETRIEVAL_BACKEND=local: in-process index only
+      - otherwise: Atlas $vectorSearch, falling back to the in-process index on error or
+        empty results. Repeated Atlas failures open `atlas_breaker`, so during the cooldown
+        queries go straight to the fallback without a failed round-trip.
+    With HYBRID_SEARCH, HYBRID_CANDIDATES vector hits are fused with BM25 hits (hybrid_merge).
+    Every doc carries "vector_score" (cosine similarity; None for BM25-only hits).
+    """
+    if query_vector is None:
+        query_vector = embed_query(query_text)
+    if not config.HYBRID_SEARCH:
+        return _vector_search(query_text, top_k, query_vector)
+    docs = _vector_search(query_text, max(top_k, config.HYBRID_CANDIDATES), query_vector)
+    return hybrid_merge(query_text, docs, top_k=top_k)
+
+
+async def amongodb_vector_search(query_text, top_k=3, query_vector=None):
+    """ Async Atlas $vectorSearch over the AsyncMongoClient. """
+    if query_vector is None:
+        query_vector = await aembed_query(query_text)
+    cursor = await get_async_collection().aggregate(_vector_search_pipeline(query_vector, top_k))
+    return await cursor.to_list(length=None)
+
+
+async def _avector_search(query_text, top_k, query_vector):
+    if config.RETRIEVAL_BACKEND != "local" and atlas_breaker.allow():
+        try:
+            docs = await amongodb_vector_search(query_text, top_k=top_k, query_vector=query_vector)
+            if not docs:
+                raise RuntimeError("Atlas returned no results")
+            atlas_breaker.record_success()
+            return _with_vector_scores(docs, atlas=True)
+        except Exception:
+            atlas_breaker.record_failure()
+
+    docs = await alocal_index_search(query_text, top_k=top_k, query_vector=query_vector)
+    return _with_vector_scores(docs, atlas=False)
+
+
+async def asearch(query_text, top_k=3, query_vector=None):
+    """
+    Async search(): same Atlas -> fallback logic, circuit breaker and hybrid fusion.
+    Mongo I/O (Atlas, version checks, hydration) is awaited on the AsyncMongoClient;
+    embedding, the in-process index search and BM25 run on the bounded CPU executor.
+    """
+    if query_vector is None:
+        query_vector = await aembed_query(query_text)
+    if not config.HYBRID_SEARCH:
+        return await _avector_search(query_text, top_k, query_vector)
+    docs = await _avector_search(query_text, max(top_k, config.HYBRID_CANDIDATES), query_vector)
+    return await ahybrid_merge(query_text, docs, top_k=top_k)
+
 
 def test_search(query="What is Python programming?", top_k=3):
     """Quick demo of retrieval."""
@@ -98,6 +1028,17 @@ def test_search(query="What is Python programming?", top_k=3):
 # =========================
 # CLI: allow safe insert with explicit --wipe flag
 # =========================
+def _cli_ingest_dir(path, batch_size=None, checkpoint_path=None, delete_missing=False, workers=None):
+    """Stream every .txt/.md file under `path` into the collection, resumable via checkpoint."""
+    return ingest_stream(
+        iter_chunks_from_dir(path),
+        batch_size=batch_size,
+        checkpoint_path=checkpoint_path,
+        label=os.path.abspath(path),
+        delete_missing=delete_missing,
+        workers=workers,
+    )
+
 def _cli_insert_sample_chunks(wipe: bool):
     # Example minimal chunks, replace or call insert_documents() programmatically as needed
     chunks = [
@@ -108,17 +1049,35 @@ def _cli_insert_sample_chunks(wipe: bool):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--wipe", action="store_true", help="Wipe collection before inserting sample documents (requires confirmation).")
+    # --wipe replaces the collection with the sample documents, so it can't follow an ingest
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--wipe", action="store_true", help="Wipe collection before inserting sample documents (requires confirmation).")
     parser.add_argument("--test-search", action="store_true", help="Run test_search after inserting/connecting.")
+    source.add_argument("--ingest-dir", type=str, default=None, help="Chunk, embed and upsert every .txt/.md file under this directory.")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks per embed/write batch (default: INGEST_BATCH_SIZE).")
+    parser.add_argument("--checkpoint", type=str, default="data/ingest_checkpoint.json", help="Progress file used to resume --ingest-dir after a crash.")
+    parser.add_argument("--delete-missing", action="store_true", help="With --ingest-dir, delete stored chunks that are no longer in the directory.")
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes for --ingest-dir (default: INGEST_WORKERS).")
+    parser.add_argument("--migrate-embeddings", choices=["binary", "array"], default=None, help="Convert stored embeddings in place to this format, in batches of --batch-size.")
     args = parser.parse_args()
 
+    if args.migrate_embeddings:
+        migrate_embedding_format(args.migrate_embeddings, batch_size=args.batch_size)
+
+    if args.ingest_dir:
+        if os.path.dirname(args.checkpoint):
+            os.makedirs(os.path.dirname(args.checkpoint), exist_ok=True)
+        _cli_ingest_dir(args.ingest_dir, batch_size=args.batch_size,
+                        checkpoint_path=args.checkpoint, delete_missing=args.delete_missing,
+                        workers=args.workers)
+
     if args.wipe:
         confirm = input("Type YES to confirm wiping the collection and inserting sample docs: ")
         if confirm != "YES":
             print("Wipe aborted by user. No changes made.")
             sys.exit(0)
         _cli_insert_sample_chunks(wipe=True)
-    else:
+    elif not args.ingest_dir and not args.migrate_embeddings:
         print("No wipe flag provided; running without modifying collection.")
     if args.test_search:
         test_search()
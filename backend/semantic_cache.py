@@ -0,0 +1,111 @@
+# backend/semantic_cache.py
+"""
+Semantic answer cache: a new question reuses a recent answer when its embedding is
+close enough (cosine >= threshold) to a question already answered, so
+"who created python?" and "Who created Python" share one LLM call.
+"""
+
+import threading
+import time
+
+import numpy as np
+import config
+
+
+class SemanticCache:
+    """
+    Fixed-size table of (normalized question embedding, pipeline result), bounded by
+    max_size (least recently used entry is replaced) and ttl_seconds.
+    Everything is dropped when the collection version changes (see set_version).
+    """
+
+    def __init__(self, threshold=0.92, max_size=256, ttl_seconds=3600, dim=None, version_check_seconds=30):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds  # 0 = entries never expire
+        self.version_check_seconds = version_check_seconds
+        dim = dim or config.EMBED_DIM
+        self._vectors = np.zeros((max_size, dim), dtype=np.float32)
+        self._valid = np.zeros(max_size, dtype=bool)
+        self._stored_at = np.zeros(max_size)
+        self._last_used = np.zeros(max_size)
+        self._entries = [None] * max_size  # (question, result, pipeline latency in seconds)
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def _normalize(vector):
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, query_vector):
+        """Return the cached result for the closest question above threshold, or None."""
+        q = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            if self.ttl_seconds:
+                expired = self._valid & (now - self._stored_at > self.ttl_seconds)
+                self._valid[expired] = False
+            slots = np.flatnonzero(self._valid)
+            if slots.size:
+                scores = self._vectors[slots] @ q
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = slots[best]
+                    self._last_used[slot] = now
+                    self.hits += 1
+                    self.latency_saved += self._entries[slot][2]
+                    return self._entries[slot][1]
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, question, result, latency_seconds=0.0):
+        """Cache `result`, replacing an empty, expired or least recently used slot."""
+        now = time.monotonic()
+        with self._lock:
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if free.size else int(np.argmin(self._last_used))
+            self._vectors[slot] = self._normalize(query_vector)
+            self._entries[slot] = (question, result, float(latency_seconds))
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+            self._valid[slot] = True
+
+    def clear(self):
+        with self._lock:
+            self._valid[:] = False
+            self._entries = [None] * self.max_size
+            self.invalidations += 1
+
+    def version_check_due(self) -> bool:
+        """True at most once per version_check_seconds; the caller then calls set_version()."""
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_seconds:
+            return False
+        self._version_checked_at = now
+        return True
+
+    def set_version(self, version):
+        """Record the knowledge-base version; a change from the last one clears the cache."""
+        if self._version is not None and version != self._version:
+            self.clear()
+        self._version = version
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(self._valid.sum()),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+                "invalidations": self.invalidations,
+            }
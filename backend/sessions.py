@@ -0,0 +1,156 @@
+# backend/sessions.py
+"""
+Bounded conversation sessions: each user/channel gets its own short history, older turns
+are folded into a fixed-size summary, and idle or excess sessions are evicted, so memory
+and per-turn work stay flat however long a conversation runs.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+_SENTENCE_RE = re.compile(r"^(.+?[.!?])(?:\s|$)")
+_SOURCE_TAG_RE = re.compile(r"\s*\[source:[^\]]*\]")
+# follow-ups: an anaphoric pronoun as the opening subject ("it", "does it", "how do they"),
+# or a clearly elliptical question ("and for Django?", "what about X?")
+_FOLLOW_UP_RE = re.compile(
+    r"^(?:(?:what|how|why|when|where|which|who)\s+)?"
+    r"(?:(?:is|are|was|were|do|does|did|can|could|should|would|will)\s+)?"
+    r"(?:it|its|they|them|their|those|these|that one)\b"
+    r"|^(?:and|what about|and what about|same for)\b",
+    re.IGNORECASE,
+)
+
+TURN_CHARS = 500           # a stored message is cut to this many characters
+RETRIEVAL_QUERY_CHARS = 300
+
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(_SOURCE_TAG_RE.sub("", text).split())
+    m = _SENTENCE_RE.match(text)
+    return m.group(1) if m else text[:160]
+
+
+class Session:
+    """
+    One conversation: the last `recent_turns` messages verbatim plus an extractive summary
+    of everything older ("Q: ... A: <first sentence>"), trimmed from the oldest end to
+    `summary_chars`. No LLM call is involved, so compaction costs microseconds.
+    """
+
+    def __init__(self, recent_turns=4, summary_chars=600):
+        self.turns = deque()  # {"role": "user"|"assistant", "content": str}
+        self.summary = ""
+        self.recent_turns = recent_turns
+        self.summary_chars = summary_chars
+        self.last_used = time.monotonic()
+
+    def add(self, role: str, content: str):
+        self.turns.append({"role": role, "content": content.strip()[:TURN_CHARS]})
+        while len(self.turns) > self.recent_turns:
+            self._fold(self.turns.popleft())
+        self.last_used = time.monotonic()
+
+    def _fold(self, turn):
+        if turn["role"] == "user":
+            line = f"Q: {' '.join(turn['content'].split())[:160]}"
+        else:
+            line = f"A: {_first_sentence(turn['content'])}"
+        summary = f"{self.summary} {line}".strip()
+        if len(summary) > self.summary_chars:
+            summary = summary[-self.summary_chars:]
+            cut = summary.find(" Q: ")
+            summary = "… " + (summary[cut + 1:] if cut >= 0 else summary)
+        self.summary = summary
+
+    def last_user_message(self):
+        for turn in reversed(self.turns):
+            if turn["role"] == "user":
+                return turn["content"]
+        return None
+
+    def history_block(self) -> str:
+        """Summary + recent turns, formatted for the prompt (bounded by construction)."""
+        lines = [f"Earlier: {self.summary}"] if self.summary else []
+        for turn in self.turns:
+            prefix = "User:" if turn["role"] == "user" else "Assistant:"
+            lines.append(f"{prefix} {' '.join(turn['content'].split())}")
+        return "\n".join(lines)
+
+    def size(self) -> int:
+        """Approximate memory footprint in characters."""
+        return len(self.summary) + sum(len(t["content"]) for t in self.turns)
+
+
+def standalone_query(question: str, session: Session) -> str:
+    """
+    Short retrieval query for `question`: the question itself, or, for a follow-up that
+    leans on earlier context ("what about its license?"), the previous user question
+    followed by this one. Never includes the conversation history block.
+    """
+    question = " ".join(question.split())
+    previous = session.last_user_message()
+    if previous and _FOLLOW_UP_RE.match(question):
+        question = f"{' '.join(previous.split())} {question}"
+    return question[-RETRIEVAL_QUERY_CHARS:]
+
+
+class SessionStore:
+    """
+    Thread-safe LRU of session key -> Session. Sessions idle for ttl_seconds are dropped,
+    and least recently used ones are evicted beyond max_sessions or max_chars in total.
+    """
+
+    def __init__(self, max_sessions=1000, ttl_seconds=1800, max_chars=4_000_000,
+                 recent_turns=4, summary_chars=600):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_chars = max_chars
+        self.recent_turns = recent_turns
+        self.summary_chars = summary_chars
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key) -> Session:
+        """The session for `key`, created if missing or expired."""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and self.ttl_seconds and time.monotonic() - session.last_used > self.ttl_seconds:
+                del self._sessions[key]
+                self.evictions += 1
+                session = None
+            if session is None:
+                session = Session(self.recent_turns, self.summary_chars)
+                self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            return session
+
+    def enforce_limits(self):
+        """Evict expired sessions, then LRU ones while over max_sessions / max_chars."""
+        now = time.monotonic()
+        with self._lock:
+            if self.ttl_seconds:
+                for key in [k for k, s in self._sessions.items() if now - s.last_used > self.ttl_seconds]:
+                    del self._sessions[key]
+                    self.evictions += 1
+            total = sum(s.size() for s in self._sessions.values())
+            while self._sessions and (len(self._sessions) > self.max_sessions or total > self.max_chars):
+                _, session = self._sessions.popitem(last=False)
+                total -= session.size()
+                self.evictions += 1
+
+    def reset(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "chars": sum(s.size() for s in self._sessions.values()),
+                "max_chars": self.max_chars,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,38 @@
+# backend/singleflight.py
+"""
+Single-flight request coalescing for asyncio: concurrent callers with the same key
+await one shared run instead of each doing the same work.
+"""
+
+import asyncio
+
+
+class AsyncSingleFlight:
+    """
+    do(key, fn, ...) runs `await fn(...)` once per key at a time; callers arriving while
+    it is in flight await the same result (or exception). The shared run is its own task,
+    so a cancelled caller never cancels the work other callers are waiting on.
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # key -> asyncio.Task
+        self.calls = 0        # runs actually started
+        self.coalesced = 0    # callers served by someone else's run
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _t: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,281 @@
+# backend/vector_index.py
+"""
+In-process vector indexes, built once from the MongoDB collection and kept in memory.
+All vectors are L2-normalized on build, so inner product == cosine similarity
+(the same score fallback_search computes).
+"""
+
+import numpy as np
+
+faiss = None  # imported on first use by load_faiss(); optional, only the FAISS index types need it
+_faiss_checked = False
+
+
+def load_faiss():
+    """Import faiss on first call (keeps it out of module import time); None if not installed."""
+    global faiss, _faiss_checked
+    if not _faiss_checked:
+        try:
+            import faiss as _faiss
+            faiss = _faiss
+        except ImportError:
+            faiss = None
+        _faiss_checked = True
+    return faiss
+
+
+# =========================
+# 1. Helpers
+# =========================
+def normalize_rows(vectors) -> np.ndarray:
+    """
+    Return a contiguous float32 copy of `vectors` with every row scaled to unit length.
+    Zero rows are left as zeros.
+    """
+    vecs = np.array(vectors, dtype=np.float32, ndmin=2, copy=True)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vecs /= norms
+    return np.ascontiguousarray(vecs)
+
+
+def as_id_array(ids) -> np.ndarray:
+    """
+    Ids as a NumPy array for fancy indexing. String arrays (e.g. memory-mapped from an
+    index snapshot) are used as they are; anything else becomes an object array.
+    """
+    if isinstance(ids, np.ndarray) and ids.dtype.kind == "U":
+        return ids
+    return np.asarray(ids, dtype=object)
+
+
+# =========================
+# 2. NumPy matrix index
+# =========================
+class MatrixIndex:
+    """
+    Exact cosine search without FAISS: one pre-normalized float32 matrix plus an id array.
+    Scoring is a single matrix-vector product; top-k selection uses np.argpartition.
+    """
+
+    index_type = "numpy"
+
+    def __init__(self, ids, vectors):
+        self.matrix = normalize_rows(vectors)
+        if len(ids) != self.matrix.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {self.matrix.shape[0]} vectors")
+        self.ids = as_id_array(ids)
+        self.dim = int(self.matrix.shape[1])
+
+    @classmethod
+    def from_normalized(cls, ids, matrix):
+        """Wrap an already-normalized float32 matrix (e.g. memory-mapped) without copying it."""
+        if len(ids) != matrix.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {matrix.shape[0]} vectors")
+        index = cls.__new__(cls)
+        index.matrix = matrix
+        index.ids = as_id_array(ids)
+        index.dim = int(matrix.shape[1])
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vector, top_k=3):
+        """
+        Return (ids, scores) of the top_k most similar vectors, best first.
+        """
+        n = len(self.ids)
+        if n == 0 or top_k <= 0:
+            return [], []
+        q = normalize_rows(query_vector)[0]
+        scores = self.matrix @ q
+        k = min(top_k, n)
+        if k < n:
+            top = np.argpartition(scores, n - k)[n - k:]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        return self.ids[top].tolist(), scores[top].astype(float).tolist()
+
+
+# =========================
+# 3. FAISS index
+# =========================
+class FaissIndex:
+    """
+    FAISS inner-product index over normalized vectors.
+      - "flat": exact search (IndexFlatIP)
+      - "ivf":  inverted lists, approximate (IndexIVFFlat, nprobe lists scanned per query)
+      - "hnsw": graph-based, approximate (IndexHNSWFlat, efSearch candidates per query)
+    """
+
+    def __init__(self, ids, vectors, index_type="flat", nlist=100, nprobe=8, hnsw_m=32, ef_search=64):
+        if load_faiss() is None:
+            raise RuntimeError("faiss is not installed (pip install faiss-cpu)")
+
+        vecs = normalize_rows(vectors)
+        if len(ids) != vecs.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {vecs.shape[0]} vectors")
+
+        self.ids = as_id_array(ids)
+        self.dim = int(vecs.shape[1])
+        if index_type == "ivf" and vecs.shape[0] == 0:
+            index_type = "flat"  # nothing to train the coarse quantizer on yet
+        self.index_type = index_type
+
+        if index_type == "flat":
+            index = faiss.IndexFlatIP(self.dim)
+        elif index_type == "ivf":
+            # IVF needs at least nlist training points; shrink nlist for small collections
+            nlist = max(1, min(nlist, vecs.shape[0]))
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(vecs)
+            index.nprobe = min(nprobe, nlist)
+            self._quantizer = quantizer  # keep a reference so it isn't garbage collected
+        elif index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = ef_search
+        else:
+            raise ValueError(f"Unknown index type: {index_type!r} (expected flat, ivf or hnsw)")
+
+        index.add(vecs)
+        self.index = index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_vector, top_k=3):
+        """
+        Return (ids, scores) of the top_k most similar vectors, best first.
+        """
+        if len(self.ids) == 0 or top_k <= 0:
+            return [], []
+        q = normalize_rows(query_vector)
+        scores, positions = self.index.search(q, min(top_k, len(self.ids)))
+        hits = [(self.ids[p], float(s)) for p, s in zip(positions[0], scores[0]) if p >= 0]
+        return [h[0] for h in hits], [h[1] for h in hits]
+
+
+def build_index(ids, vectors, index_type="flat", **kwargs):
+    """
+    Build the configured index type from ids + raw vectors.
+    "numpy" (or any FAISS type when faiss isn't installed) gives an exact MatrixIndex.
+    """
+    if index_type == "numpy" or load_faiss() is None:
+        return MatrixIndex(ids, vectors)
+    return FaissIndex(ids, vectors, index_type=index_type, **kwargs)
+
+
+# =========================
+# 4. Compact vector codes (float16 / int8 / 1-bit binary)
+# =========================
+# Codes are uint8 rows, so each document's code is one bytes blob in MongoDB:
+#   float16: d half floats                        (2d bytes)
+#   int8:    float32 scale + d int8 values        (d + 4 bytes, per-vector scale = max|v| / 127)
+#   binary:  sign bits, np.packbits               (d / 8 bytes)
+COMPACT_STORAGE = ("float16", "int8", "binary")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def code_size(storage, dim) -> int:
+    """Bytes per vector for a storage type ("float32" included, for comparison)."""
+    return {"float32": 4 * dim, "float16": 2 * dim, "int8": dim + 4, "binary": (dim + 7) // 8}[storage]
+
+
+def encode_compact(vectors, storage) -> np.ndarray:
+    """Normalize `vectors` and encode each row as a compact uint8 code (see COMPACT_STORAGE)."""
+    vecs = normalize_rows(vectors)
+    if storage == "float16":
+        return vecs.astype("<f2").view(np.uint8)
+    if storage == "int8":
+        scales = np.abs(vecs).max(axis=1, keepdims=True) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vecs / scales), -127, 127).astype(np.int8)
+        return np.hstack([scales.astype("<f4").view(np.uint8), codes.view(np.uint8)])
+    if storage == "binary":
+        return np.packbits(vecs > 0, axis=1)
+    raise ValueError(f"Unknown vector storage: {storage!r} (expected one of {', '.join(COMPACT_STORAGE)})")
+
+
+class QuantizedIndex:
+    """
+    Two-stage search over compact codes:
+      1. approximate scores for every vector from its code (float16 / int8 dot product,
+         or Hamming distance for binary), keeping top_k * oversample candidates
+      2. exact float32 cosine rescoring of just those candidates, with vectors supplied by
+         fetch_vectors(ids) -> {id: vector} (e.g. one MongoDB $in query)
+    Without fetch_vectors (or oversample <= 1) the approximate scores are returned.
+    """
+
+    _BLOCK = 65536  # rows decoded to float32 at a time, bounding per-query scratch memory
+
+    def __init__(self, ids, codes, storage, dim, fetch_vectors=None, oversample=4):
+        codes = np.ascontiguousarray(codes, dtype=np.uint8).reshape(-1, code_size(storage, dim))
+        if len(ids) != codes.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {codes.shape[0]} codes")
+        self.ids = as_id_array(ids)
+        self.index_type = storage
+        self.dim = dim
+        self.fetch_vectors = fetch_vectors
+        self.oversample = oversample
+        self.codes = codes
+        if storage == "float16":
+            self._values = codes.view("<f2")
+        elif storage == "int8":
+            self._scales = codes[:, :4].copy().view("<f4").ravel()
+            self._values = codes[:, 4:].view(np.int8)
+
+    @classmethod
+    def from_vectors(cls, ids, vectors, storage, **kwargs):
+        vecs = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        return cls(ids, encode_compact(vecs, storage), storage, vecs.shape[1], **kwargs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes)
+
+    def approximate_scores(self, query_vector) -> np.ndarray:
+        q = normalize_rows(query_vector)[0]
+        if self.index_type == "binary":
+            q_bits = np.packbits(q > 0)
+            hamming = _POPCOUNT[np.bitwise_xor(self.codes, q_bits)].sum(axis=1, dtype=np.int32)
+            return 1.0 - 2.0 * hamming / self.dim
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), self._BLOCK):
+            block = self._values[start:start + self._BLOCK].astype(np.float32)
+            scores[start:start + self._BLOCK] = block @ q
+        if self.index_type == "int8":
+            scores *= self._scales
+        return scores
+
+    def search(self, query_vector, top_k=3):
+        """
+        Return (ids, scores) of the top_k most similar vectors, best first
+        (exact cosine scores when rescoring, approximate otherwise).
+        """
+        n = len(self.ids)
+        if n == 0 or top_k <= 0:
+            return [], []
+        rescore = self.fetch_vectors is not None and self.oversample > 1
+        scores = self.approximate_scores(query_vector)
+        k = min(top_k * self.oversample if rescore else top_k, n)
+        top = np.argpartition(scores, n - k)[n - k:] if k < n else np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        cand_ids, cand_scores = self.ids[top].tolist(), scores[top].astype(float).tolist()
+        if not rescore:
+            return cand_ids, cand_scores
+
+        vectors = self.fetch_vectors(cand_ids)
+        kept = [i for i in cand_ids if i in vectors]
+        if not kept:
+            return cand_ids[:top_k], cand_scores[:top_k]
+        exact = normalize_rows(np.stack([np.asarray(vectors[i], dtype=np.float32) for i in kept]))
+        exact = exact @ normalize_rows(query_vector)[0]
+        order = np.argsort(exact)[::-1][:top_k]
+        return [kept[i] for i in order], exact[order].astype(float).tolist()
@@ -0,0 +1,92 @@
+"""
+bench_embed_backends.py - compare embedding inference backends against the PyTorch baseline.
+
+Run from the project root (needs the embedding model, no MongoDB):
+
+    python -m benchmarks.bench_embed_backends
+    python -m benchmarks.bench_embed_backends --backends torch onnx onnx-int8 torch-int8 --corpus docs
+
+For each backend (see EMBED_BACKEND in config.py):
+- single-query encode latency (p50 / p99 over the sample questions)
+- batch throughput (chunks/sec encoding the corpus in batches of --batch_size)
+- retrieval agreement with "torch": mean top-k overlap of exact cosine search over the
+  corpus, and mean cosine between the two backends' embeddings of the same text
+"""
+
+import argparse
+import json
+import re
+import time
+
+import numpy as np
+
+from backend.embeddings import EMBED_BACKENDS, load_model
+from backend.retrieval import iter_chunks_from_dir
+from backend.vector_index import MatrixIndex, normalize_rows
+
+
+def load_queries():
+    queries = []
+    with open("tests/sample_questions.txt", encoding="utf-8") as f:
+        for line in f:
+            line = re.sub(r"^\s*\d+\.\s*", "", line).strip()
+            if line:
+                queries.append(line)
+    with open("tests/eval_tests.json", encoding="utf-8") as f:
+        queries += [t["query"] for t in json.load(f)]
+    return queries
+
+
+def measure(model, corpus, queries, batch_size, repeats):
+    model.encode(["warmup"], convert_to_numpy=True)
+    latencies = []
+    for _ in range(repeats):
+        for q in queries:
+            t0 = time.perf_counter()
+            model.encode([q], convert_to_numpy=True)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    t0 = time.perf_counter()
+    corpus_vecs = model.encode(corpus, batch_size=batch_size, convert_to_numpy=True)
+    throughput = len(corpus) / (time.perf_counter() - t0)
+    query_vecs = model.encode(queries, convert_to_numpy=True)
+    return np.asarray(latencies), throughput, corpus_vecs, query_vecs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare embedding backends (latency, throughput, top-k agreement)")
+    parser.add_argument("--backends", nargs="+", default=list(EMBED_BACKENDS), choices=EMBED_BACKENDS)
+    parser.add_argument("--corpus", type=str, default="docs", help="Directory of .md/.txt files to chunk and search")
+    parser.add_argument("--batch_size", type=int, default=64)
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=5, help="Passes over the queries for latency")
+    args = parser.parse_args()
+
+    corpus = [c["text"] for c in iter_chunks_from_dir(args.corpus)]
+    queries = load_queries()
+    ids = list(range(len(corpus)))
+    print(f"corpus={len(corpus)} chunks from {args.corpus}/  queries={len(queries)}  top_k={args.top_k}\n")
+
+    baseline = None
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    print("backend     |  load s |   p50 ms |   p99 ms |  chunks/s | top-k overlap | mean cos vs torch")
+    for backend in backends:
+        try:
+            t0 = time.perf_counter()
+            model = load_model(backend)
+            load_s = time.perf_counter() - t0
+        except Exception as e:
+            print(f"{backend:<11} | skipped: {e}")
+            continue
+        lat, throughput, corpus_vecs, query_vecs = measure(model, corpus, queries, args.batch_size, args.repeats)
+        index = MatrixIndex(ids, corpus_vecs)
+        hits = [set(index.search(q, args.top_k)[0]) for q in query_vecs]
+
+        if baseline is None:
+            baseline = (hits, corpus_vecs)
+            overlap, cos = 1.0, 1.0
+        else:
+            overlap = np.mean([len(a & b) / max(len(a), 1) for a, b in zip(baseline[0], hits)])
+            cos = float(np.mean(np.sum(normalize_rows(baseline[1]) * normalize_rows(corpus_vecs), axis=1)))
+        print(f"{backend:<11} | {load_s:7.1f} | {np.percentile(lat, 50):8.2f} | {np.percentile(lat, 99):8.2f} | "
+              f"{throughput:9.1f} | {overlap:13.3f} | {cos:.4f}")
+        del model
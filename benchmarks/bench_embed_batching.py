@@ -0,0 +1,108 @@
+"""
+bench_embed_batching.py - load test of micro-batched vs per-call query embedding.
+
+Run from the project root (needs the embedding model, no MongoDB):
+
+    python -m benchmarks.bench_embed_batching
+    python -m benchmarks.bench_embed_batching --concurrency 1 8 32 64 --requests 2000
+
+For each concurrency level, `concurrency` callers issue single-query embeds as fast as
+they can (distinct texts, query cache bypassed so every request really encodes):
+- direct:  embed_texts([text]) per call (the pre-batching behaviour)
+- batched: EmbeddingBatcher.embed(text) (threads) / aembed (asyncio)
+Reports throughput (queries/sec) and p50 / p99 latency.
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+import config
+from backend.embed_batcher import EmbeddingBatcher
+from backend.embeddings import embed_texts, run_in_cpu_executor
+
+
+def encode_uncached(texts):
+    return embed_texts(texts, use_cache=False)
+
+
+def run_threads(call, texts, concurrency):
+    """Run `call(text)` for every text from `concurrency` threads; return (elapsed s, latencies ms)."""
+    latencies = []
+    lock = threading.Lock()
+    it = iter(texts)
+
+    def worker():
+        while True:
+            with lock:
+                text = next(it, None)
+            if text is None:
+                return
+            t0 = time.perf_counter()
+            call(text)
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, np.asarray(latencies)
+
+
+async def run_async(acall, texts, concurrency):
+    """Same as run_threads, with `concurrency` asyncio tasks on one event loop."""
+    latencies = []
+    queue = asyncio.Queue()
+    for text in texts:
+        queue.put_nowait(text)
+
+    async def worker():
+        while not queue.empty():
+            text = queue.get_nowait()
+            t0 = time.perf_counter()
+            await acall(text)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - t0, np.asarray(latencies)
+
+
+def report(mode, concurrency, n, elapsed, lat):
+    print(f"{mode:<14} | {concurrency:>4} | {n / elapsed:9.1f} q/s | "
+          f"p50 {np.percentile(lat, 50):8.2f} ms | p99 {np.percentile(lat, 99):8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test micro-batched query embedding")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--max_batch", type=int, default=config.EMBED_MICROBATCH_MAX_BATCH)
+    parser.add_argument("--wait_ms", type=float, default=config.EMBED_MICROBATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    encode_uncached(["warmup"])  # load the model outside the timed region
+    batcher = EmbeddingBatcher(encode_uncached, max_batch=args.max_batch, max_wait_ms=args.wait_ms)
+    print(f"requests={args.requests} max_batch={args.max_batch} wait_ms={args.wait_ms}\n")
+    print("mode           | conc |  throughput |      latency p50 |      latency p99")
+
+    for concurrency in args.concurrency:
+        texts = [f"question {concurrency}-{i}: how do I configure the discord bot?" for i in range(args.requests)]
+        elapsed, lat = run_threads(lambda t: encode_uncached([t]), texts, concurrency)
+        report("direct/thread", concurrency, len(texts), elapsed, lat)
+        elapsed, lat = run_threads(batcher.embed, texts, concurrency)
+        report("batched/thread", concurrency, len(texts), elapsed, lat)
+
+        elapsed, lat = asyncio.run(run_async(lambda t: run_in_cpu_executor(encode_uncached, [t]), texts, concurrency))
+        report("direct/async", concurrency, len(texts), elapsed, lat)
+        elapsed, lat = asyncio.run(run_async(batcher.aembed, texts, concurrency))
+        report("batched/async", concurrency, len(texts), elapsed, lat)
+        print()
+
+    print("batcher stats:", batcher.stats())
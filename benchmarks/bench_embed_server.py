@@ -0,0 +1,111 @@
+"""
+bench_embed_server.py - memory footprint and query latency of N embedding clients,
+each with its own in-process model versus all sharing one backend.embed_server process.
+
+Run from the project root (needs the embedding model, no MongoDB):
+
+    python -m benchmarks.bench_embed_server
+    python -m benchmarks.bench_embed_server --clients 1 2 4 8 --queries 100
+
+Each client is a fresh process that embeds the sample questions one at a time (no query
+cache, like distinct user questions) and reports its p50 / p95 latency and resident memory.
+Total RSS is the sum over clients, plus the server process in server mode.
+"""
+
+import argparse
+import multiprocessing
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from benchmarks.bench_embed_backends import load_queries
+
+
+def rss_mb(pid="self") -> float:
+    """Resident set size of a process in MB (Linux /proc)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def client(socket_path, authkey, queries, barrier, results):
+    # config was already imported when this module was re-imported in the spawned child,
+    # so set the socket on config itself (an env var would be read too late)
+    config.EMBED_SERVER_SOCKET = socket_path or ""
+    config.EMBED_SERVER_AUTHKEY = authkey or ""
+    from backend import embeddings
+    t0 = time.perf_counter()
+    embeddings.warmup()
+    startup = time.perf_counter() - t0
+    barrier.wait()  # all clients query at the same time
+    if socket_path:
+        assert embeddings._model is None, "server-mode client loaded its own model"
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        embeddings.embed_texts([q], use_cache=False)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    results.put((startup, latencies, rss_mb()))
+
+
+def start_server(socket_path, authkey):
+    env = dict(os.environ, EMBED_SERVER_AUTHKEY=authkey)
+    proc = subprocess.Popen([sys.executable, "-m", "backend.embed_server", "--socket", socket_path], env=env)
+    deadline = time.time() + 300
+    while not os.path.exists(socket_path):
+        if proc.poll() is not None or time.time() > deadline:
+            raise RuntimeError("embedding server failed to start")
+        time.sleep(0.1)
+    return proc
+
+
+def run_mode(n_clients, queries, socket_path=None, authkey=None):
+    ctx = multiprocessing.get_context("spawn")
+    barrier, results = ctx.Barrier(n_clients), ctx.Queue()
+    procs = [ctx.Process(target=client, args=(socket_path, authkey, queries, barrier, results)) for _ in range(n_clients)]
+    for p in procs:
+        p.start()
+    out = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    startup = max(o[0] for o in out)
+    latencies = np.concatenate([o[1] for o in out])
+    return startup, latencies, sum(o[2] for o in out)
+
+
+def report(name, n, startup, lat, total_rss):
+    print(f"{n:>3} clients | {name:<10} | startup {startup:6.2f}s | p50 {np.percentile(lat, 50):7.2f} ms | "
+          f"p95 {np.percentile(lat, 95):7.2f} ms | total RSS {total_rss:8.0f} MB")
+
+
+def run(client_counts, n_queries):
+    queries = (load_queries() * n_queries)[:n_queries]
+    socket_path = os.path.join(tempfile.mkdtemp(), "embed.sock")
+    authkey = secrets.token_hex(32)  # throwaway key shared by this run's server and clients
+    print(f"queries per client={len(queries)}\n")
+    for n in client_counts:
+        report("in-process", n, *run_mode(n, queries))
+        server = start_server(socket_path, authkey)
+        try:
+            startup, lat, clients_rss = run_mode(n, queries, socket_path, authkey)
+            report("server", n, startup, lat, clients_rss + rss_mb(server.pid))
+        finally:
+            server.terminate()
+            server.wait()
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark a shared embedding server against per-process models")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    run(args.clients, args.queries)
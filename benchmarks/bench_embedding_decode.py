@@ -0,0 +1,47 @@
+"""
+bench_embedding_decode.py - cost of reading stored embeddings: BSON double array vs packed binary.
+
+Run from the project root (no MongoDB or model needed):
+
+    python -m benchmarks.bench_embedding_decode
+    python -m benchmarks.bench_embedding_decode --n 100000 --dim 384
+
+Builds --n documents shaped like the collection ({_id, embedding}) in each
+EMBED_STORAGE_FORMAT, BSON-encodes them, then times what a full-collection read
+does: bson.decode_all (what pymongo does per batch) + turning every embedding into
+a row of a float32 matrix. Reports bytes per document and decode throughput.
+"""
+
+import argparse
+import time
+
+import bson
+import numpy as np
+
+from backend.embedding_store import decode_embedding, encode_embedding
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding decode: BSON array vs binary vector")
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    vectors = np.random.default_rng(0).standard_normal((args.n, args.dim), dtype=np.float32)
+    print(f"n={args.n:,} dim={args.dim}\n")
+    print("format | bytes/doc | decode_all s | to matrix s |   docs/s")
+    for storage_format in ("array", "binary"):
+        raw = b"".join(bson.encode({"_id": i, "embedding": encode_embedding(v, storage_format)})
+                       for i, v in enumerate(vectors))
+        best_decode = best_matrix = float("inf")
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            docs = bson.decode_all(raw)
+            t1 = time.perf_counter()
+            matrix = np.stack([decode_embedding(d["embedding"]) for d in docs])
+            t2 = time.perf_counter()
+            best_decode, best_matrix = min(best_decode, t1 - t0), min(best_matrix, t2 - t1)
+        assert np.array_equal(matrix, vectors)
+        print(f"{storage_format:<6} | {len(raw) // args.n:9} | {best_decode:12.3f} | {best_matrix:11.3f} | "
+              f"{args.n / (best_decode + best_matrix):8.0f}")
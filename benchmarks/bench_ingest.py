@@ -0,0 +1,86 @@
+"""
+bench_ingest.py - ingestion encode throughput (chunks/sec) by worker count.
+
+Run from the project root (needs the embedding model, no MongoDB):
+
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest --workers 1 2 4 8 --chunks 4000 --batch_size 256
+
+workers=1 encodes in-process (the default ingestion path); workers>1 uses
+embeddings.EncodePool with one batch in flight per worker, as ingest_stream does.
+Pool start-up (one model load per worker) is reported separately from throughput.
+"""
+
+import argparse
+import random
+import time
+from collections import deque
+
+from backend.embeddings import EncodePool, embed_texts
+
+_WORDS = ("python model data training discord bot server message vector index query "
+          "embedding chunk token latency batch worker process memory cache search").split()
+
+
+def synthetic_chunks(n, chars=1000, seed=0):
+    """Chunk-sized random texts (about CHUNK_SIZE characters each)."""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(n):
+        words = [f"chunk{i}"]
+        while sum(len(w) + 1 for w in words) < chars:
+            words.append(rng.choice(_WORDS))
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_in_process(chunks, batch_size):
+    embed_texts(chunks[:2], use_cache=False)  # load the model outside the timed region
+    t0 = time.perf_counter()
+    for batch in batches(chunks, batch_size):
+        embed_texts(batch, use_cache=False)
+    return 0.0, time.perf_counter() - t0
+
+
+def run_pool(chunks, batch_size, workers):
+    t0 = time.perf_counter()
+    pool = EncodePool(workers)
+    # one tiny task per worker forces every model to load before timing
+    for f in [pool.submit(["warmup"]) for _ in range(workers)]:
+        f.result()
+    startup = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    in_flight = deque()
+    for batch in batches(chunks, batch_size):
+        in_flight.append(pool.submit(batch))
+        while len(in_flight) > workers:
+            in_flight.popleft().result()
+    while in_flight:
+        in_flight.popleft().result()
+    elapsed = time.perf_counter() - t0
+    pool.close()
+    return startup, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion encode throughput by worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch_size", type=int, default=256)
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks)
+    print(f"chunks={args.chunks} batch_size={args.batch_size}\n")
+    print("workers | startup s | encode s | chunks/sec")
+    for workers in args.workers:
+        if workers <= 1:
+            startup, elapsed = run_in_process(chunks, args.batch_size)
+        else:
+            startup, elapsed = run_pool(chunks, args.batch_size, workers)
+        print(f"{workers:>7} | {startup:9.2f} | {elapsed:8.2f} | {args.chunks / elapsed:10.1f}")
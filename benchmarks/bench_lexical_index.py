@@ -0,0 +1,67 @@
+"""
+bench_lexical_index.py - BM25 build time, size and query latency (hybrid search).
+
+Run from the project root (no MongoDB or model needed):
+
+    python -m benchmarks.bench_lexical_index
+    python -m benchmarks.bench_lexical_index --sizes 10000 100000 --queries 500
+
+Synthetic chunks draw ~150 words each from a Zipf-distributed vocabulary (so common
+terms have very long postings lists, like real text). Queries mix frequent and rare
+terms. Reports build time, postings size, and p50 / p99 latency for BM25 search and
+for the reciprocal rank fusion step.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from backend.lexical_index import BM25Index, reciprocal_rank_fusion
+
+
+def synthetic_corpus(n, vocab_size=50_000, words_per_doc=150, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"term{i}" for i in range(vocab_size)])
+    ranks = np.minimum(rng.zipf(1.1, size=n * words_per_doc), vocab_size) - 1
+    words = vocab[ranks].reshape(n, words_per_doc)
+    return [" ".join(row) for row in words], vocab
+
+
+def percentiles(latencies):
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the BM25 inverted index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top_k", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    print("      docs | build s | postings MB | bm25 p50 ms | bm25 p99 ms | rrf p50 ms")
+    for n in args.sizes:
+        texts, vocab = synthetic_corpus(n)
+        t0 = time.perf_counter()
+        index = BM25Index(list(range(n)), texts)
+        build_s = time.perf_counter() - t0
+        del texts
+
+        # 2-5 word queries: one frequent term (top 100) plus mid/rare terms
+        queries = [
+            " ".join([vocab[rng.integers(0, 100)]] + list(vocab[rng.integers(100, 20_000, rng.integers(1, 5))]))
+            for _ in range(args.queries)
+        ]
+        bm25_ms, rrf_ms = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            ids, _ = index.search(q, top_k=args.top_k)
+            bm25_ms.append((time.perf_counter() - t0) * 1000)
+            vector_ids = rng.integers(0, n, args.top_k).tolist()
+            t0 = time.perf_counter()
+            reciprocal_rank_fusion([vector_ids, ids], top_k=3)
+            rrf_ms.append((time.perf_counter() - t0) * 1000)
+        b50, b99 = percentiles(bm25_ms)
+        r50, _ = percentiles(rrf_ms)
+        print(f"{n:>10,} | {build_s:7.1f} | {index.nbytes / 1e6:11.1f} | {b50:11.3f} | {b99:11.3f} | {r50:10.4f}")
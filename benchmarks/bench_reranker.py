@@ -0,0 +1,56 @@
+"""
+bench_reranker.py - cross-encoder rerank latency by candidate count and batch size.
+
+Run from the project root (needs the reranker model, no MongoDB):
+
+    python -m benchmarks.bench_reranker
+    python -m benchmarks.bench_reranker --candidates 10 30 50 --batch_sizes 8 16 32
+
+Candidates are chunks of docs/ paired with the sample questions. For each setting,
+reports p50 / p99 latency of a cold rerank (nothing cached), of the same rerank
+repeated (all cached), and how often RERANK_BUDGET_MS would have been exceeded.
+For answer quality, compare `python evaluation.py` with RERANK_ENABLED=true/false.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import config
+from backend.reranker import Reranker
+from backend.retrieval import iter_chunks_from_dir
+from benchmarks.bench_embed_backends import load_queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark cross-encoder reranking")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--budget_ms", type=float, default=config.RERANK_BUDGET_MS)
+    parser.add_argument("--corpus", type=str, default="docs")
+    args = parser.parse_args()
+
+    chunks = [{"_id": i, **c} for i, c in enumerate(iter_chunks_from_dir(args.corpus))]
+    queries = load_queries()
+    rng = np.random.default_rng(0)
+    print(f"model={config.RERANK_MODEL} chunks={len(chunks)} queries={len(queries)} budget={args.budget_ms} ms\n")
+    print("cands | batch | cold p50 ms | cold p99 ms | cached p50 ms | over budget")
+
+    for batch_size in args.batch_sizes:
+        reranker = Reranker(config.RERANK_MODEL, batch_size=batch_size)
+        reranker.warmup()
+        for n in args.candidates:
+            reranker.clear()
+            cold, cached, over = [], [], 0
+            for q in queries:
+                docs = [chunks[i] for i in rng.choice(len(chunks), size=min(n, len(chunks)), replace=False)]
+                t0 = time.perf_counter()
+                reranker.rerank(q, docs, top_k=3, budget_ms=0)
+                cold.append((time.perf_counter() - t0) * 1000)
+                over += cold[-1] > args.budget_ms
+                t0 = time.perf_counter()
+                reranker.rerank(q, docs, top_k=3, budget_ms=0)
+                cached.append((time.perf_counter() - t0) * 1000)
+            print(f"{n:5} | {batch_size:5} | {np.percentile(cold, 50):11.1f} | {np.percentile(cold, 99):11.1f} | "
+                  f"{np.percentile(cached, 50):13.2f} | {over}/{len(queries)}")
@@ -0,0 +1,80 @@
+"""
+bench_startup.py - cold-start regression tracker: import time and time-to-first-answer.
+
+Run from the project root:
+
+    python -m benchmarks.bench_startup                 # import times only (no services needed)
+    python -m benchmarks.bench_startup --answer        # + warmup and first answer (needs Mongo/Azure/model)
+
+Every measurement runs in a fresh interpreter, so nothing is shared between runs.
+Import times are the median of --repeats runs.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "config",
+    "backend.embeddings",
+    "backend.retrieval",
+    "backend.llm",
+    "backend.RAG_pipeline",
+    "evaluation",
+]
+
+_IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import {module}
+print(time.perf_counter() - t0)
+"""
+
+_ANSWER_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+from backend.RAG_pipeline import run_rag_pipeline, warmup
+t_import = time.perf_counter()
+steps = warmup()
+t_warm = time.perf_counter()
+run_rag_pipeline({question!r})
+t_answer = time.perf_counter()
+print(json.dumps({{
+    "import_s": t_import - t0,
+    "warmup_s": t_warm - t_import,
+    "warmup_steps_s": steps,
+    "first_answer_s": t_answer - t_warm,
+    "total_s": t_answer - t0,
+}}))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_snippet(code):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]  # modules may print status lines first
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark import time and time-to-first-answer")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--answer", action="store_true", help="Also time warmup() + first run_rag_pipeline call")
+    parser.add_argument("--question", type=str, default="Who created Python?")
+    args = parser.parse_args()
+
+    print("module                 | import (median of {}) ".format(args.repeats))
+    for module in MODULES:
+        try:
+            times = [float(run_snippet(_IMPORT_SNIPPET.format(module=module))) for _ in range(args.repeats)]
+            print(f"{module:<22} | {statistics.median(times) * 1000:8.1f} ms")
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<22} | failed: {e.stderr.strip().splitlines()[-1] if e.stderr else e}")
+
+    if args.answer:
+        result = json.loads(run_snippet(_ANSWER_SNIPPET.format(question=args.question)))
+        print("\nTime to first answer:")
+        print(json.dumps(result, indent=2))
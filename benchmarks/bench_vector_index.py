@@ -0,0 +1,102 @@
+"""
+bench_vector_index.py - query latency of the in-process vector indexes on synthetic data.
+
+Run from the project root (no MongoDB or model needed):
+
+    python -m benchmarks.bench_vector_index
+    python -m benchmarks.bench_vector_index --sizes 10000 100000 1000000 --queries 200
+
+Compares, per corpus size:
+- loop:   the old fallback_search scoring (per-document np.asarray + np.dot over Python lists)
+- numpy:  vector_index.MatrixIndex (one matrix-vector product + np.argpartition)
+- faiss:  vector_index.FaissIndex flat / hnsw (only if faiss is installed; hnsw up to --hnsw_max)
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from backend import vector_index
+
+
+def synthetic_vectors(n, dim, seed=0, batch=100_000):
+    """Random float32 vectors, generated in batches to keep peak memory near n*dim*4 bytes."""
+    rng = np.random.default_rng(seed)
+    out = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, batch):
+        stop = min(n, start + batch)
+        out[start:stop] = rng.standard_normal((stop - start, dim), dtype=np.float32)
+    return out
+
+
+def loop_search(docs, q_emb, top_k):
+    """The pre-index fallback_search scoring loop, minus the Mongo transfer."""
+    qnorm = np.linalg.norm(q_emb)
+    sims = []
+    for d in docs:
+        d_emb = np.asarray(d["embedding"], dtype=np.float32)
+        denom = qnorm * np.linalg.norm(d_emb)
+        score = float(np.dot(q_emb, d_emb) / denom) if denom != 0 else 0.0
+        sims.append({"_id": d["_id"], "score": score})
+    return sorted(sims, key=lambda x: x["score"], reverse=True)[:top_k]
+
+
+def time_queries(fn, queries):
+    """Return per-query latencies in milliseconds."""
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return np.asarray(latencies)
+
+
+def report(name, n, build_s, lat_ms):
+    print(f"{n:>9,} | {name:<11} | build {build_s:7.2f}s | "
+          f"p50 {np.percentile(lat_ms, 50):8.3f} ms | p95 {np.percentile(lat_ms, 95):8.3f} ms")
+
+
+def run(sizes, dim, n_queries, top_k, loop_max, hnsw_max):
+    queries = synthetic_vectors(n_queries, dim, seed=1)
+    print(f"dim={dim} queries={n_queries} top_k={top_k}\n")
+    for n in sizes:
+        vectors = synthetic_vectors(n, dim)
+        ids = np.arange(n)
+
+        if n <= loop_max:
+            docs = [{"_id": i, "embedding": v.tolist()} for i, v in zip(ids, vectors)]
+            lat = time_queries(lambda q: loop_search(docs, q, top_k), queries[:10])
+            report("loop", n, 0.0, lat)
+            del docs
+
+        t0 = time.perf_counter()
+        index = vector_index.MatrixIndex(ids, vectors)
+        build_s = time.perf_counter() - t0
+        report("numpy", n, build_s, time_queries(lambda q: index.search(q, top_k), queries))
+        del index
+
+        if vector_index.load_faiss() is not None:
+            for index_type in ("flat", "hnsw"):
+                if index_type == "hnsw" and n > hnsw_max:
+                    continue
+                t0 = time.perf_counter()
+                index = vector_index.FaissIndex(ids, vectors, index_type=index_type)
+                build_s = time.perf_counter() - t0
+                report(f"faiss-{index_type}", n, build_s, time_queries(lambda q: index.search(q, top_k), queries))
+                del index
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark in-process vector index query latency")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--loop_max", type=int, default=10_000,
+                        help="Largest size to run the slow per-document loop baseline on")
+    parser.add_argument("--hnsw_max", type=int, default=100_000,
+                        help="Largest size to build the (slow to build) HNSW index for")
+    args = parser.parse_args()
+    run(args.sizes, args.dim, args.queries, args.top_k, args.loop_max, args.hnsw_max)
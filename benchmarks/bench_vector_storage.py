@@ -0,0 +1,93 @@
+"""
+bench_vector_storage.py - storage size and recall@k of compact vector codes.
+
+Run from the project root:
+
+    python -m benchmarks.bench_vector_storage                       # synthetic clustered vectors
+    python -m benchmarks.bench_vector_storage --n 200000 --top_k 10
+    python -m benchmarks.bench_vector_storage --source mongo        # vectors stored in the collection
+
+For float32 and each VECTOR_STORAGE type (float16 / int8 / binary):
+- bytes per vector as stored in MongoDB (BSON double array for the current float32
+  `embedding`, raw bytes for the codes) and total size / savings vs the BSON array
+- recall@k against exact float32 search, for the compact pass alone and with
+  float32 rescoring of top_k * oversample candidates
+- query latency p50 of the two-stage search (rescoring vectors come from memory here,
+  so the MongoDB $in round-trip is not included)
+"""
+
+import argparse
+import time
+
+import bson
+import numpy as np
+
+from backend import vector_index
+
+
+def clustered_vectors(n, dim, n_queries, clusters=256, noise=0.35, seed=0):
+    """Gaussian clusters (real embeddings are far from uniform); queries are perturbed corpus points."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    corpus = centers[rng.integers(0, clusters, n)] + noise * rng.standard_normal((n, dim), dtype=np.float32)
+    picks = rng.integers(0, n, n_queries)
+    queries = corpus[picks] + noise * rng.standard_normal((n_queries, dim), dtype=np.float32)
+    return corpus, queries
+
+
+def mongo_vectors(n_queries, seed=0):
+    from backend.embedding_store import decode_embedding
+    from backend.retrieval import get_collection
+    vectors = [decode_embedding(d["embedding"]) for d in get_collection().find({}, {"embedding": 1}) if "embedding" in d]
+    corpus = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), n_queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    return corpus, queries
+
+
+def recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storage savings and recall@k of compact vector codes")
+    parser.add_argument("--source", choices=["synthetic", "mongo"], default="synthetic")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--oversample", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.source == "mongo":
+        corpus, queries = mongo_vectors(args.queries)
+    else:
+        corpus, queries = clustered_vectors(args.n, args.dim, args.queries)
+    n, dim = corpus.shape
+    ids = np.arange(n)
+    exact = vector_index.MatrixIndex(ids, corpus)
+    truth = [exact.search(q, args.top_k)[0] for q in queries]
+    by_id = dict(zip(ids.tolist(), corpus))
+    fetch = lambda wanted: {i: by_id[i] for i in wanted}
+
+    bson_bytes = len(bson.encode({"embedding": corpus[0].tolist()}))  # current storage, per document
+    print(f"n={n:,} dim={dim} queries={len(queries)} top_k={args.top_k} oversample={args.oversample}\n")
+    print("storage  | bytes/vec | total MB | vs BSON array | recall@k (codes) | recall@k (rescored) | p50 ms")
+    print(f"{'bson[]':<8} | {bson_bytes:9} | {bson_bytes * n / 1e6:8.1f} | {'1.0x':>13} | {'1.000':>16} | {'-':>19} | -")
+    print(f"{'float32':<8} | {4 * dim:9} | {4 * dim * n / 1e6:8.1f} | "
+          f"{bson_bytes / (4 * dim):12.1f}x | {'1.000':>16} | {'-':>19} | -")
+
+    for storage in vector_index.COMPACT_STORAGE:
+        approx = vector_index.QuantizedIndex.from_vectors(ids, corpus, storage)
+        rescored = vector_index.QuantizedIndex(ids, approx.codes, storage, dim,
+                                               fetch_vectors=fetch, oversample=args.oversample)
+        r_codes = recall([approx.search(q, args.top_k)[0] for q in queries], truth)
+        latencies, found = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            found.append(rescored.search(q, args.top_k)[0])
+            latencies.append((time.perf_counter() - t0) * 1000)
+        size = vector_index.code_size(storage, dim)
+        print(f"{storage:<8} | {size:9} | {size * n / 1e6:8.1f} | {bson_bytes / size:12.1f}x | "
+              f"{r_codes:16.3f} | {recall(found, truth):19.3f} | {np.percentile(latencies, 50):.2f}")
@@ -0,0 +1,67 @@
+"""
+calibrate_threshold.py - pick RETRIEVAL_MIN_SCORE (the out-of-domain LLM skip gate) from labeled questions.
+
+Place at project root (same level as `backend/`). Run:
+
+    python calibrate_threshold.py
+    python calibrate_threshold.py --labels tests/domain_labels.json --min_recall 0.95
+
+Each labeled question {"query": str, "in_domain": bool} is retrieved exactly as
+run_rag_pipeline does (no LLM calls), and its best vector score (cosine) is recorded.
+The chosen threshold is the highest one that still lets through at least --min_recall
+of the in-domain questions (minus --margin for safety); the report shows how many
+out-of-domain questions it would answer without an LLM call.
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from backend import retrieval
+from backend.RAG_pipeline import best_vector_score
+
+
+def score_questions(cases, top_k):
+    """Return [(query, in_domain, best vector score)] using the pipeline's retrieval path."""
+    scored = []
+    for case in cases:
+        docs = retrieval.search(case["query"], top_k=top_k)
+        best = best_vector_score(docs)
+        scored.append((case["query"], bool(case["in_domain"]), -1.0 if best is None else best))
+    return scored
+
+
+def pick_threshold(scored, min_recall, margin):
+    """Highest threshold keeping >= min_recall of in-domain questions, lowered by margin."""
+    in_scores = np.sort([s for _, d, s in scored if d])
+    if len(in_scores) == 0:
+        raise ValueError("need at least one in-domain question")
+    allowed_misses = int(np.floor((1 - min_recall) * len(in_scores)))
+    return float(in_scores[allowed_misses]) - margin
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate RETRIEVAL_MIN_SCORE from labeled questions")
+    parser.add_argument("--labels", type=str, default="tests/domain_labels.json", help="JSON list of {query, in_domain}")
+    parser.add_argument("--min_recall", type=float, default=1.0, help="Fraction of in-domain questions that must pass")
+    parser.add_argument("--margin", type=float, default=0.02, help="Subtracted from the chosen score for safety")
+    parser.add_argument("--top_k", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.labels, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    scored = score_questions(cases, args.top_k)
+
+    print("best score | label | query")
+    for query, in_domain, score in sorted(scored, key=lambda x: x[2], reverse=True):
+        print(f"{score:10.3f} | {'in ' if in_domain else 'out'}   | {query}")
+
+    threshold = pick_threshold(scored, args.min_recall, args.margin)
+    passed_in = sum(1 for _, d, s in scored if d and s >= threshold)
+    gated_out = sum(1 for _, d, s in scored if not d and s < threshold)
+    n_in = sum(1 for _, d, _ in scored if d)
+    n_out = len(scored) - n_in
+    print(f"\nThreshold {threshold:.3f}: in-domain answered {passed_in}/{n_in}, "
+          f"out-of-domain skipped without LLM {gated_out}/{n_out}")
+    print(f"\nAdd to .env:\nRETRIEVAL_MIN_SCORE={threshold:.3f}")
@@ -23,3 +23,146 @@ INDEX_NAME = os.getenv("INDEX_NAME")
 # Embeddings / Models
 MODEL_NAME = os.getenv("MODEL_NAME")
 EMBED_DIM = int(os.getenv("EMBED_DIM", 384))
+
+# Retrieval backend
+# "atlas" = Atlas $vectorSearch with fallback, "local" = in-process index built once from the collection
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "atlas")
+LOCAL_INDEX_TYPE = os.getenv("LOCAL_INDEX_TYPE", "flat")  # "flat"/"numpy" (exact), "ivf" or "hnsw" (approximate)
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", 100))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 8))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+
+# Local index snapshot: the ids + normalized vectors (or compact codes) are saved here after
+# every build and memory-mapped by later processes while the collection version and document
+# count still match, so startup skips the collection scan and processes share the pages.
+# Empty = disabled
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "data/index_snapshot")
+# How often (seconds) a process re-reads the collection version to notice writes made by
+# other processes (e.g. python -m backend.retrieval --ingest-dir) and rebuild its local
+# vector / BM25 indexes
+LOCAL_INDEX_VERSION_CHECK_SECONDS = float(os.getenv("LOCAL_INDEX_VERSION_CHECK_SECONDS", 30))
+
+# Atlas circuit breaker: after this many consecutive $vectorSearch failures,
+# skip Atlas for the cooldown and go straight to the local fallback
+ATLAS_FAILURE_THRESHOLD = int(os.getenv("ATLAS_FAILURE_THRESHOLD", 3))
+ATLAS_COOLDOWN_SECONDS = float(os.getenv("ATLAS_COOLDOWN_SECONDS", 60))
+
+# Query embedding cache (LRU in front of embed_texts); TTL 0 = no expiry
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 1024))
+EMBED_CACHE_TTL_SECONDS = float(os.getenv("EMBED_CACHE_TTL_SECONDS", 0))
+
+# On-disk embedding cache for ingestion (keyed by chunk content hash); empty = disabled
+EMBED_CACHE_DB = os.getenv("EMBED_CACHE_DB", "data/embedding_cache.sqlite")
+
+# Ingestion (chunking matches the notebook's RecursiveCharacterTextSplitter settings)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 50))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))  # >1 = encode in that many worker processes
+
+# Threads reserved for CPU-bound embedding / local search when called from async code
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", 2))
+
+# Semantic answer cache (Discord bot): reuse an answer when a new question's embedding
+# has cosine >= threshold with a recently answered one
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 256))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 3600))
+SEMANTIC_CACHE_VERSION_CHECK_SECONDS = float(os.getenv("SEMANTIC_CACHE_VERSION_CHECK_SECONDS", 30))
+
+# Micro-batching of single-query embeddings: concurrent queries arriving within
+# EMBED_MICROBATCH_WAIT_MS are encoded in one model call (up to MAX_BATCH texts)
+EMBED_MICROBATCH = os.getenv("EMBED_MICROBATCH", "true").lower() in ("1", "true", "yes")
+EMBED_MICROBATCH_WAIT_MS = float(os.getenv("EMBED_MICROBATCH_WAIT_MS", 2))
+EMBED_MICROBATCH_MAX_BATCH = int(os.getenv("EMBED_MICROBATCH_MAX_BATCH", 32))
+
+# Embedding inference backend: "torch" (default), "onnx", "onnx-int8" (pre-quantized ONNX
+# weights) or "torch-int8" (dynamic int8 quantization of the Linear layers)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "")  # override the ONNX weights file inside the model repo
+
+# Shared embedding server (python -m backend.embed_server): when EMBED_SERVER_SOCKET is set,
+# embed_texts sends encode requests to the model process on that Unix socket instead of
+# loading a model in every process. The server batches up to EMBED_SERVER_MAX_BATCH texts
+# from all clients, waiting at most EMBED_SERVER_WAIT_MS for a batch to fill
+EMBED_SERVER_SOCKET = os.getenv("EMBED_SERVER_SOCKET", "")
+EMBED_SERVER_MAX_BATCH = int(os.getenv("EMBED_SERVER_MAX_BATCH", 64))
+EMBED_SERVER_WAIT_MS = float(os.getenv("EMBED_SERVER_WAIT_MS", 2))
+# Shared secret both sides prove with an HMAC handshake before anything is unpickled:
+# EMBED_SERVER_AUTHKEY if set, else the key in EMBED_SERVER_KEY_FILE (created 0600 by the
+# server; refused unless owned by the current user and private)
+EMBED_SERVER_AUTHKEY = os.getenv("EMBED_SERVER_AUTHKEY", "")
+EMBED_SERVER_KEY_FILE = os.getenv("EMBED_SERVER_KEY_FILE", os.path.expanduser("~/.rag_embed_server.key"))
+
+# Compact vector storage: "float32" (default, embedding array only), or also store a
+# "float16" / "int8" / "binary" code per chunk (field embedding_<type>). The local index then
+# scans the compact codes and rescores the top_k * VECTOR_RESCORE_OVERSAMPLE candidates with
+# exact float32 vectors fetched by id (oversample <= 1 = no rescoring)
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32")
+VECTOR_RESCORE_OVERSAMPLE = int(os.getenv("VECTOR_RESCORE_OVERSAMPLE", 4))
+
+# How the float32 `embedding` field is stored: "array" (BSON array of doubles) or "binary"
+# (packed little-endian float32 BSON binary vector, subtype 9; decoded with np.frombuffer).
+# Convert an existing collection with: python -m backend.retrieval --migrate-embeddings binary
+EMBED_STORAGE_FORMAT = os.getenv("EMBED_STORAGE_FORMAT", "array")
+
+# LRU cache of hydrated chunk documents (text + source, by _id) for the local index path
+DOC_CACHE_SIZE = int(os.getenv("DOC_CACHE_SIZE", 512))
+
+# Hybrid retrieval (opt-in): merge BM25 (exact terms: identifiers, error strings, commands)
+# with vector search by reciprocal rank fusion over HYBRID_CANDIDATES hits from each side.
+# Building the BM25 index reads every chunk's text once per process, so it is off by default
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "false").lower() in ("1", "true", "yes")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Cross-encoder reranking: retrieve RERANK_CANDIDATES docs, rescore (query, chunk) pairs in
+# batches and keep the best top_k for the prompt. If scoring exceeds RERANK_BUDGET_MS the
+# retrieval order is used instead
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 30))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 16))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 150))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 4096))
+
+# Prompt context: chunks are packed into at most CONTEXT_TOKEN_BUDGET tokens
+# (counted with tiktoken's CONTEXT_ENCODING, the tokenizer of the chat deployment)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1200))
+CONTEXT_ENCODING = os.getenv("CONTEXT_ENCODING", "cl100k_base")
+
+# Conversation sessions (backend/chatbot.py), keyed by user or channel id: LRU over at most
+# SESSION_MAX_SESSIONS, idle sessions expire after SESSION_TTL_SECONDS, and all sessions
+# together hold at most SESSION_MAX_CHARS of history. Each session keeps its last
+# SESSION_RECENT_TURNS messages verbatim and folds older ones into a summary of at most
+# SESSION_SUMMARY_CHARS
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", 1000))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 1800))
+SESSION_MAX_CHARS = int(os.getenv("SESSION_MAX_CHARS", 4_000_000))
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", 4))
+SESSION_SUMMARY_CHARS = int(os.getenv("SESSION_SUMMARY_CHARS", 600))
+
+# Out-of-domain gate: if the best retrieved chunk's cosine similarity is below this,
+# answer "I don't know" without calling the LLM. 0 = off; pick a value with
+# python calibrate_threshold.py
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", 0))
+
+# Azure OpenAI admission control (backend/llm_scheduler.py): requests and estimated tokens
+# per minute the deployment allows (0 = unlimited). The buckets live in LLM_BUDGET_FILE,
+# shared by every process on the host (empty = each process gets the full limits). The
+# priority queue (interactive before batch) only orders calls within one process; across
+# processes, batch calls (evaluation.py, CLI) leave LLM_BATCH_RESERVE of each bucket for
+# interactive ones (the Discord bot).
+# At most LLM_MAX_QUEUE calls wait for budget, each for at most LLM_QUEUE_TIMEOUT_SECONDS;
+# beyond that callers get a fast "busy" reply. 429s / transient errors are retried up to
+# LLM_MAX_RETRIES times with jittered exponential backoff (base .. max seconds)
+AZURE_RPM_LIMIT = int(os.getenv("AZURE_RPM_LIMIT", 360))
+AZURE_TPM_LIMIT = int(os.getenv("AZURE_TPM_LIMIT", 60000))
+LLM_BUDGET_FILE = os.getenv("LLM_BUDGET_FILE", "data/llm_budget.json")
+LLM_BATCH_RESERVE = float(os.getenv("LLM_BATCH_RESERVE", 0.25))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 50))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 20))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 1.0))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 20.0))
@@ -0,0 +1,36 @@
+"""
+build_context_from_docs drops chunk overlap only when the overlapping text is actually in
+the context: text cut from a truncated doc must still come through its neighbour.
+
+    python -m pytest -q tests
+"""
+
+import pytest
+
+import config
+from backend.RAG_pipeline import build_context_from_docs, count_tokens
+
+OVERLAP = "The shared overlap text lives at the end."
+DOC_A = ("Alpha explains the first idea in quite some detail across many many many many many more words here. "
+         "filler filler " + OVERLAP)
+DOC_B = OVERLAP + " Beta."
+
+
+@pytest.fixture(autouse=True)
+def chunk_overlap(monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_OVERLAP", 40)
+
+
+def _docs():
+    return [{"source": "a", "text": DOC_A}, {"source": "b", "text": DOC_B}]
+
+
+def test_overlap_with_emitted_text_is_dropped():
+    context = build_context_from_docs(_docs(), max_tokens=1000)
+    assert context == f"[source:a] {DOC_A}\n\n[source:b] Beta."
+
+
+def test_overlap_cut_from_truncated_doc_is_kept():
+    context = build_context_from_docs(_docs(), max_tokens=count_tokens(f"[source:a] {DOC_A}") - 1)
+    assert OVERLAP not in context.split("\n\n")[0]
+    assert context.split("\n\n")[1].startswith("[source:b] The shared overlap")
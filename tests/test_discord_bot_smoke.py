@@ -0,0 +1,35 @@
+"""
+Smoke check for the Discord bot's reply path: importing the module (without starting the
+client) and turning pipeline results / streamed deltas into the text users see.
+
+    python -m pytest -q tests
+"""
+
+import asyncio
+
+from backend import discord_bot
+
+
+def test_extract_answer_text_cleans_sources():
+    result = {"answer": "Use python -m venv .venv [source:doc_1].\nSources: doc_1", "sources": ["doc_1"]}
+    assert discord_bot.extract_answer_text(result) == "Use python -m venv .venv."
+
+
+def test_extract_answer_text_fallbacks():
+    assert discord_bot.extract_answer_text({"answer": "I don't know.", "out_of_domain": True}) == discord_bot.FALLBACK_RESPONSE
+    assert discord_bot.extract_answer_text({"answer": "i'm not sure"}) == discord_bot.FALLBACK_RESPONSE
+    assert discord_bot.extract_answer_text({"answer": "[LLM_BUSY] LLM queue full"}) == discord_bot.BUSY_RESPONSE
+    assert discord_bot.extract_answer_text(("Flask routes map URLs to views [source:doc_3]", [])) == "Flask routes map URLs to views"
+
+
+def test_progressive_reply_edits_cleaned_partial():
+    class Message:
+        content = None
+
+        async def edit(self, content):
+            self.content = content
+
+    message = Message()
+    reply = discord_bot._ProgressiveReply(message, started_at=0.0)
+    asyncio.run(reply.on_delta("Overfitting means memorising noise [source:doc_2] [sour"))
+    assert message.content == "Overfitting means memorising noise ▌"
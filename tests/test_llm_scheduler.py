@@ -0,0 +1,44 @@
+"""
+The LLM scheduler's dispatcher must outlive budget errors: an unusable shared budget file
+falls back to a per-process budget, and other errors fail only the request at the head.
+
+    python -m pytest -q tests
+"""
+
+import pytest
+
+from backend.llm_scheduler import LLMScheduler, LocalBudget, SharedBudget
+
+
+def test_unusable_shared_budget_falls_back_to_local(tmp_path):
+    budget_path = tmp_path / "budget.json"
+    budget_path.mkdir()  # opening a directory as the budget file raises IsADirectoryError
+    scheduler = LLMScheduler(SharedBudget(str(budget_path), 600, 60000), max_queue=5, queue_timeout=2.0)
+
+    scheduler.acquire(100)
+    scheduler.acquire(100)
+
+    assert type(scheduler.budget) is LocalBudget
+    assert (scheduler.budget.rpm, scheduler.budget.tpm) == (600, 60000)
+    assert scheduler._dispatcher.is_alive()
+    assert scheduler.stats()["admitted"] == 2
+
+
+def test_budget_error_fails_only_the_head_request():
+    class FlakyBudget(LocalBudget):
+        calls = 0
+
+        def try_take(self, tokens, priority):
+            self.calls += 1
+            if self.calls == 1:
+                raise ValueError("corrupt budget state")
+            return super().try_take(tokens, priority)
+
+    scheduler = LLMScheduler(FlakyBudget(600, 60000), max_queue=5, queue_timeout=2.0)
+
+    with pytest.raises(ValueError):
+        scheduler.acquire(100)
+    scheduler.acquire(100)
+
+    assert scheduler._dispatcher.is_alive()
+    assert scheduler.stats()["admitted"] == 1
@@ -0,0 +1,49 @@
+"""
+standalone_query only prepends the previous question to real follow-ups, so standalone
+questions keep their own retrieval query.
+
+    python -m pytest -q tests
+"""
+
+import pytest
+
+from backend.sessions import Session, standalone_query
+
+PREVIOUS = "How do I create a REST API with Flask?"
+
+
+def _session():
+    session = Session()
+    session.add("user", PREVIOUS)
+    session.add("assistant", "Use Flask routes that return JSON [source:doc_1].")
+    return session
+
+
+@pytest.mark.parametrize("question", [
+    "Does it support async views?",
+    "What about Django?",
+    "And for FastAPI?",
+    "Is it free for commercial use?",
+    "How do they handle authentication?",
+    "Its license?",
+])
+def test_follow_ups_include_previous_question(question):
+    assert standalone_query(question, _session()) == f"{PREVIOUS} {question}"
+
+
+@pytest.mark.parametrize("question", [
+    "What is overfitting?",
+    "Why do we use virtual environments?",
+    "Is there a way to speed up pandas?",
+    "How about pandas?",
+    "Explain gradient descent",
+    "Which one is faster, NumPy or lists?",
+    "Then what is a decorator?",
+    "Is this channel for Python questions?",
+])
+def test_standalone_questions_are_left_alone(question):
+    assert standalone_query(question, _session()) == question
+
+
+def test_no_previous_question():
+    assert standalone_query("Does it support async views?", Session()) == "Does it support async views?"